@@ -0,0 +1,357 @@
+'''
+
+Matchability - Load Test
+Starts an API server locally (Django, Flask or ASGI) or targets a running one, drives it with a reproducible mix of
+opportunity payloads at a given concurrency, and writes a JSON report of the throughput and latencies.
+From the matchability_api directory:
+
+    python -m benchmarks.loadtest --server django --concurrency 8 --duration 30 --output benchmarks/results/loadtest.json
+    python -m benchmarks.loadtest --server django --compare benchmarks/results/loadtest.json
+
+'''
+
+import argparse
+import copy
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'matchability_lib', 'Data')
+
+# Command and port of each local server, run from the matchability_api directory. 'django' is served by uwsgi as in
+# production (see config/deploy.rb), 'django-dev' by the development server, whose latencies are not representative.
+# The Flask app (matcha_api.py) always listens on port 5000.
+SERVERS = {
+    'django': (['uwsgi', '--module', 'matchability_api.wsgi', '--http-socket', '127.0.0.1:8000', '--master',
+                '--processes', '2', '--disable-logging', '--die-on-term'], 8000),
+    'django-dev': ([sys.executable, 'manage.py', 'runserver', '127.0.0.1:8000', '--noreload'], 8000),
+    'flask': ([sys.executable, os.path.join('matchability_lib', 'matcha_api.py')], 5000),
+    'asgi': ([sys.executable, '-m', 'uvicorn', 'matchability_lib.matcha_asgi:app', '--port', '8001', '--log-level',
+              'warning'], 8001),
+}
+
+# Share of each kind of payload in the generated mix
+DEFAULT_MIX = {'complete': 0.5, 'missing': 0.3, 'large_skills': 0.2}
+
+# Skills and backgrounds drawn by the synthetic payloads
+SKILLS = ['Client servicing', 'Internet usage', 'Leadership', 'Organisational Management', 'Presentation skills',
+          'Team Management', 'Windows PC usage', 'Sales', 'Photoshop', 'Marketing', 'Public speaking',
+          'Project Management', 'Social media', 'Teaching', 'Event Management', 'Microsoft Office', 'Fundraising',
+          'Data analysis', 'Web development', 'Customer service']
+BACKGROUNDS = ['Business administration', 'Public relations', 'Marketing', 'Education', 'Computer science',
+               'Economics', 'Engineering', 'Journalism', 'Psychology', 'Law']
+ENTITIES = [('Mexico', 'Americas'), ('Brazil', 'Americas'), ('India', 'Asia Pacific'), ('Egypt', 'Middle East and Africa'),
+            ('France', 'Europe'), ('Germany', 'Europe'), ('Kenya', 'Middle East and Africa'), ('Vietnam', 'Asia Pacific')]
+
+# Seconds to wait for a local server to answer
+SERVER_START_TIMEOUT = 120
+
+
+def load_payload(name):
+    with open(os.path.join(DATA_DIR, name)) as f:
+        return json.load(f)['data']
+
+
+def random_date(rng, year):
+    return '%d-%02d-%02d 00:00:00' % (year, rng.randint(1, 12), rng.randint(1, 28))
+
+
+# Complete opportunity: the sample opportunity with its dates, location, openings and skills varied
+def complete_payload(rng, base):
+    d = copy.deepcopy(base)
+    d['created_at'] = random_date(rng, 2014)
+    d['application_close_date'] = random_date(rng, 2015)
+    d['earliest_start_date'] = random_date(rng, 2015)
+    d['latest_end_date'] = random_date(rng, 2016)
+    d['duration_min'] = rng.randint(1, 52)
+    d['openings'] = rng.randint(1, 10)
+    d['name_entity'], d['name_region'] = rng.choice(ENTITIES)
+    d['programme_id'] = rng.choice([1, 2, 5])
+    d['opp_skill_req'] = ','.join(rng.sample(SKILLS, rng.randint(1, 6)))
+    d['opp_skill_pref'] = ','.join(rng.sample(SKILLS, rng.randint(0, 2)))
+    d['opp_background_req'] = ','.join(rng.sample(BACKGROUNDS, rng.randint(1, 3)))
+    d['title'] = 'Opportunity ' + str(rng.randint(0, 10 ** 9))
+    return d
+
+
+# Opportunity with missing fields: the sample missing opportunity, or a complete one with a third of its fields left out
+def missing_payload(rng, base, missing):
+    if rng.random() < 0.2:
+        d = copy.deepcopy(missing)
+        d['title'] = 'Opportunity ' + str(rng.randint(0, 10 ** 9))
+        return d
+    d = complete_payload(rng, base)
+    for field in rng.sample(sorted(d), len(d) // 3):
+        del d[field]
+    return d
+
+
+# Opportunity asking for many skills and backgrounds
+def large_skills_payload(rng, base):
+    d = complete_payload(rng, base)
+    d['opp_skill_req'] = ','.join(rng.sample(SKILLS, rng.randint(12, len(SKILLS))))
+    d['opp_skill_pref'] = ','.join(rng.sample(SKILLS, rng.randint(5, 10)))
+    d['opp_background_req'] = ','.join(rng.sample(BACKGROUNDS, rng.randint(5, len(BACKGROUNDS))))
+    d['opp_background_pref'] = ','.join(rng.sample(BACKGROUNDS, rng.randint(3, 6)))
+    return d
+
+
+# The same `size` payloads for the same mix and seed, in a shuffled order
+def payload_mix(size, mix=DEFAULT_MIX, seed=0):
+    rng = random.Random(seed)
+    base = load_payload('dummydata.json')
+    missing = load_payload('dummydatamissing.json')
+    total = float(sum(mix.values()))
+    payloads = []
+    for kind, share in sorted(mix.items()):
+        for i in range(int(round(size * share / total))):
+            if kind == 'complete':
+                payloads.append(complete_payload(rng, base))
+            elif kind == 'missing':
+                payloads.append(missing_payload(rng, base, missing))
+            elif kind == 'large_skills':
+                payloads.append(large_skills_payload(rng, base))
+            else:
+                raise ValueError("Unknown payload kind: " + kind)
+    rng.shuffle(payloads)
+    return payloads
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        kind, share = item.split('=')
+        mix[kind.strip()] = float(share)
+    return mix
+
+
+# Request bodies sent in turn by the clients: single opportunities or batches of `batch_size` of them
+def request_bodies(payloads, batch_size=None, explain=False):
+    bodies = []
+    if batch_size:
+        for start in range(0, len(payloads), batch_size):
+            bodies.append({'data': payloads[start:start + batch_size]})
+    else:
+        bodies = [{'data': d} for d in payloads]
+    for body in bodies:
+        if explain:
+            body['explain'] = True
+    return [json.dumps(body).encode('utf-8') for body in bodies]
+
+
+# Starts a local server and waits until it answers
+def start_server(name):
+    command, port = SERVERS[name]
+    env = dict(os.environ)
+    # the Flask app imports its modules from both the matchability_lib and the matchability_api directories
+    if name == 'flask':
+        env['PYTHONPATH'] = os.pathsep.join([BASE_DIR, env.get('PYTHONPATH', '')])
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:' + str(port)
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The " + name + " server exited with code " + str(process.returncode))
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api/cache/stats')
+            connection.getresponse().read()
+            connection.close()
+            return process, url
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.5)
+    process.kill()
+    raise RuntimeError("The " + name + " server did not start in " + str(SERVER_START_TIMEOUT) + " seconds")
+
+
+# A client thread: sends the bodies in turn (starting at its own offset) on a persistent connection until
+# `stop` is set or `requests` requests were sent, and records the latency and status of each request
+class Client(threading.Thread):
+
+    def __init__(self, url, path, bodies, offset, stop, requests=None):
+        super(Client, self).__init__(daemon=True)
+        self.url = urlparse(url)
+        self.path = path
+        self.bodies = bodies
+        self.offset = offset
+        self.stop = stop
+        self.requests = requests
+        self.latencies = []
+        self.errors = 0
+
+    def connect(self):
+        return http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=60)
+
+    # Returns the status of the response. A server may close a kept-alive connection after a response (uwsgi's
+    # --http-socket does): the request is then sent again on a new connection, as HTTP client libraries do.
+    def send(self, connection, body, headers):
+        try:
+            connection.request('POST', self.path, body, headers)
+            response = connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            connection.request('POST', self.path, body, headers)
+            response = connection.getresponse()
+        response.read()
+        return response.status
+
+    def run(self):
+        connection = self.connect()
+        i = self.offset
+        headers = {'Content-Type': 'application/json'}
+        while not self.stop.is_set() and (self.requests is None or len(self.latencies) < self.requests):
+            body = self.bodies[i % len(self.bodies)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                ok = self.send(connection, body, headers) < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+            self.latencies.append(time.perf_counter() - start)
+            self.errors += not ok
+        connection.close()
+
+
+# Runs `concurrency` clients for `duration` seconds (after `warmup` seconds not measured)
+def run_load(url, path, bodies, concurrency, duration, warmup=0):
+    if warmup:
+        stop = threading.Event()
+        clients = [Client(url, path, bodies, i * 7919, stop) for i in range(concurrency)]
+        for client in clients:
+            client.start()
+        time.sleep(warmup)
+        stop.set()
+        for client in clients:
+            client.join()
+
+    stop = threading.Event()
+    clients = [Client(url, path, bodies, i * 7919, stop) for i in range(concurrency)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    time.sleep(duration)
+    stop.set()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for client in clients for latency in client.latencies]) * 1000
+    errors = sum(client.errors for client in clients)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(len(latencies) / elapsed, 2),
+        'latency_ms': dict((name, round(float(value), 3)) for name, value in [
+            ('mean', latencies.mean() if len(latencies) else 0),
+            ('p50', np.percentile(latencies, 50) if len(latencies) else 0),
+            ('p95', np.percentile(latencies, 95) if len(latencies) else 0),
+            ('p99', np.percentile(latencies, 99) if len(latencies) else 0),
+            ('max', latencies.max() if len(latencies) else 0),
+        ]),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Relative changes between a report and a baseline report, and whether they are beyond the tolerance
+def compare_reports(report, baseline, tolerance):
+    changes = {}
+    regressions = []
+    old, new = baseline['results']['requests_per_s'], report['results']['requests_per_s']
+    changes['requests_per_s'] = (new - old) / old if old else 0.0
+    if changes['requests_per_s'] < -tolerance:
+        regressions.append('requests_per_s')
+    for name in ['p50', 'p95', 'p99']:
+        old, new = baseline['results']['latency_ms'][name], report['results']['latency_ms'][name]
+        changes['latency_' + name] = (new - old) / old if old else 0.0
+        if changes['latency_' + name] > tolerance:
+            regressions.append('latency_' + name)
+    return {'baseline_commit': baseline.get('commit'),
+            'changes': dict((name, round(change, 4)) for name, change in changes.items()),
+            'regressions': regressions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the matchability API.")
+    parser.add_argument('--server', choices=sorted(SERVERS), default='django', help="Local server to start")
+    parser.add_argument('--url', help="URL of a running server to test instead of starting one")
+    parser.add_argument('--endpoint', choices=['opportunity', 'batch'], default='opportunity')
+    parser.add_argument('--batch-size', type=int, default=50, help="Opportunities per request of the batch endpoint")
+    parser.add_argument('--explain', action='store_true', help="Ask for the explanation of the predictions")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent clients")
+    parser.add_argument('--duration', type=float, default=20, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=3, help="Seconds of load before the measure")
+    parser.add_argument('--payloads', type=int, default=2000, help="Distinct opportunities sent")
+    parser.add_argument('--mix', default=','.join(kind + '=' + str(share) for kind, share in sorted(DEFAULT_MIX.items())),
+                        help="Share of each kind of payload: complete, missing, large_skills")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON report file (printed otherwise)")
+    parser.add_argument('--compare', help="Baseline JSON report to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Relative change beyond which the comparison fails (exit code 1)")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    batch_size = args.batch_size if args.endpoint == 'batch' else None
+    bodies = request_bodies(payload_mix(args.payloads, mix, args.seed), batch_size, args.explain)
+    path = '/api/opportunity/batch' if args.endpoint == 'batch' else '/api/opportunity'
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args.server)
+    try:
+        results = run_load(url, path, bodies, args.concurrency, args.duration, args.warmup)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {'server': args.server if args.url is None else args.url, 'endpoint': args.endpoint,
+                   'batch_size': batch_size, 'explain': args.explain, 'concurrency': args.concurrency,
+                   'duration_s': args.duration, 'warmup_s': args.warmup, 'payloads': args.payloads, 'mix': mix,
+                   'seed': args.seed},
+        'results': results,
+    }
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != report['config']:
+            print("Warning: the baseline was run with a different configuration", file=sys.stderr)
+        report['comparison'] = compare_reports(report, baseline, args.tolerance)
+        exit_code = 1 if report['comparison']['regressions'] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
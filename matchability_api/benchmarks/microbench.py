@@ -0,0 +1,379 @@
+'''
+
+Matchability - Micro-benchmarks
+Times each stage of the scoring (field extraction, date diffs, HDI lookup, skills clustering, forest, serialization)
+and of the training (date cleaning, extra columns, hstore parsing, openings expansion) in isolation, on fixed
+synthetic inputs of several sizes, and writes one JSON report per run. Two reports can then be compared stage by stage.
+From the matchability_api directory:
+
+    python -m benchmarks.microbench run
+    python -m benchmarks.microbench compare benchmarks/results/<baseline>.json --threshold 0.2
+
+'''
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import warnings
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.loadtest import BACKGROUNDS, BASE_DIR, ENTITIES, SKILLS, git_commit, payload_mix
+from matchability_lib.clustering import ClusterAssigner
+from matchability_lib.featurizer import FEATURE_GROUPS, logistics_features, row_features, row_skills_text, \
+    skills_text, specifics_features, to_frame
+from matchability_lib.matchability import ROW_TRANSFORM_MAX_ITEMS, predict
+from matchability_lib.registry import registry
+from matchability_lib.training import clean_date_columns, expand_openings, extra_columns, weighted_openings
+
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+
+# Rows per input of the scoring stages and of the training stages
+SCORING_SIZES = [1, 100, 10000]
+TRAINING_SIZES = [10000, 100000]
+
+# Feature groups (featurizer.py) timed by the field extraction, date diffs and HDI lookup stages
+FIELD_GROUPS = ['openings', 'text', 'skills', 'media', 'specifics', 'logistics', 'programme']
+DATE_GROUPS = ['dates']
+HDI_GROUPS = ['location']
+
+DATE_COLUMNS = ['created_at', 'applications_close_date', 'earliest_start_date', 'latest_end_date']
+
+# A measure lasts at least MIN_MEASURE_TIME seconds (fast stages are run several times per measure)
+MIN_MEASURE_TIME = 0.2
+
+
+# ----------------------- INPUTS --------------------------------###
+
+def random_dates(rng, rows, year):
+    days = rng.randint(0, 365, rows)
+    dates = np.datetime64(str(year) + '-01-01') + days.astype('timedelta64[D]')
+    return pd.Series(dates.astype(str)) + ' 00:00:00'
+
+
+# Opportunities as read from aiesec_opportunities_extracted.csv by matcha.py, with a few of the malformed dates of the
+# extraction (two digit years, wrong century, missing)
+def training_opportunities(rows, seed=0):
+    rng = np.random.RandomState(seed)
+    entities = [ENTITIES[i] for i in rng.randint(0, len(ENTITIES), rows)]
+    frame = pd.DataFrame({
+        'opportunity_id': np.arange(1, rows + 1),
+        'title': ['Opportunity ' + str(i) for i in range(rows)],
+        'description': ['Description of the opportunity ' + str(i) for i in range(rows)],
+        'openings': np.minimum(rng.geometric(0.35, rows), 500),
+        'duration_min': rng.randint(6, 79, rows).astype(float),
+        'created_at': random_dates(rng, rows, 2014),
+        'applications_close_date': random_dates(rng, rows, 2015),
+        'earliest_start_date': random_dates(rng, rows, 2015),
+        'latest_end_date': random_dates(rng, rows, 2016),
+        'name_entity': [name for name, region in entities],
+        'name_region': [region for name, region in entities],
+        'programme_id': rng.choice(['Global Volunteer', 'Global Talent', 'Global Entrepreneur'], rows),
+        'opp_skill_req': [','.join(rng.choice(SKILLS, rng.randint(1, 6), replace=False)) for i in range(rows)],
+        'opp_background_req': [','.join(rng.choice(BACKGROUNDS, rng.randint(1, 3), replace=False))
+                               for i in range(rows)],
+        'opp_language_req': rng.choice(['English', 'English,Spanish', 'French'], rows),
+        'specifics_info': ['"salary"=>"' + str(salary) + '", "salary_currency"=>"USD", "computer"=>"' + computer +
+                           '", "expected_work_schedule"=>"{:from=>\\"10:00\\", :to=>\\"18:00\\"}"'
+                           for salary, computer in zip(rng.randint(0, 1000, rows),
+                                                       rng.choice(['true', 'false'], rows))],
+        'logistics_info': ['"food_covered"=>"' + str(meals) + ' meals per day", "accommodation_covered"=>"' + covered +
+                           '", "food_weekends"=>"false", "transportation_covered"=>"' + transport + '"'
+                           for meals, covered, transport in zip(rng.randint(0, 4, rows),
+                                                                rng.choice(['true', 'false'], rows),
+                                                                rng.choice(['One way', 'Return trip', 'None'], rows))],
+        'legal_info': rng.choice(['"health_insurance_info"=>"Not mandatory"', '"health_insurance_info"=>"Mandatory"',
+                                  '"visa_work_permit_info"=>"Will be provided"'], rows),
+        'role_info': ['"supervisor"=>"Supervisor ' + str(i) + '", "learning_points"=>"Team building"'
+                      for i in range(rows)],
+    })
+    frame.loc[rng.rand(rows) < 0.02, 'duration_min'] = np.nan
+    for column in DATE_COLUMNS:
+        malformed = rng.rand(rows)
+        frame.loc[malformed < 0.01, column] = frame[column].str[2:]
+        frame.loc[(malformed >= 0.01) & (malformed < 0.02), column] = '00' + frame[column].str[2:]
+        frame.loc[(malformed >= 0.02) & (malformed < 0.03), column] = np.nan
+    return frame
+
+
+# Accepted applications of the opportunities (two per opportunity on average)
+def training_applications(opps, seed=0):
+    rng = np.random.RandomState(seed + 1)
+    rows = 2 * len(opps)
+    return pd.DataFrame({'application_id': np.arange(rows),
+                         'opportunity_id': opps['opportunity_id'].values[rng.randint(0, len(opps), rows)],
+                         'an_status': 'accepted'})
+
+
+# Input of the openings expansion: the opportunities with their integer openings and accepted counts
+def expansion_input(opps, seed=0):
+    rng = np.random.RandomState(seed + 2)
+    opps = opps.copy()
+    opps['openings'] = opps['openings'].astype(int)
+    opps['accepted_count'] = (opps['openings'] * rng.rand(len(opps))).astype(int)
+    return opps
+
+
+# ----------------------- STAGES --------------------------------###
+# Each stage prepares its input once and returns a function running the stage on it
+
+# Base features of the given groups, one payload at a time or over a frame, as the scoring does for that many rows
+def feature_groups_stage(names, include_frame=False):
+    groups = [group for group in FEATURE_GROUPS if group.name in names]
+
+    def prepare(payloads, models):
+        if len(payloads) <= ROW_TRANSFORM_MAX_ITEMS:
+            return lambda: [row_features(d, groups) for d in payloads]
+        if include_frame:
+            def run():
+                frame = to_frame(payloads)
+                return [group.compute(frame) for group in groups]
+            return run
+        frame = to_frame(payloads)
+        return lambda: [group.compute(frame) for group in groups]
+    return prepare
+
+
+# Skills TF-IDF + k-means prediction, without the cluster cache
+def clusters_stage(payloads, models):
+    assigner = ClusterAssigner(models.vectorizer, models.kmeans, cache_size=0)
+    if len(payloads) <= ROW_TRANSFORM_MAX_ITEMS:
+        return lambda: [assigner.assign_one(row_skills_text(d)) for d in payloads]
+    skills = skills_text(to_frame(payloads))
+    return lambda: assigner.assign(skills)
+
+
+def forest_stage(payloads, models):
+    x_data = models.featurizer.transform(payloads)
+    return lambda: models.forest.predict_proba(x_data)
+
+
+# JSON response of the opportunity endpoint (a single opportunity) or of the batch endpoint
+def serialize_stage(payloads, models):
+    prob, output = predict(models.featurizer.transform(payloads), models)
+    results = [{'status': 'OK', 'output': str(output[i]), 'value': prob[i]} for i in range(len(payloads))]
+    timestamp = str(datetime.now())
+    if len(payloads) == 1:
+        return lambda: json.dumps(dict(results[0], timestamp=timestamp))
+    return lambda: json.dumps({'status': 'OK', 'results': results, 'timestamp': timestamp})
+
+
+SCORING_STAGES = [
+    ('fields', feature_groups_stage(FIELD_GROUPS, include_frame=True)),
+    ('dates', feature_groups_stage(DATE_GROUPS)),
+    ('hdi', feature_groups_stage(HDI_GROUPS)),
+    ('clusters', clusters_stage),
+    ('forest', forest_stage),
+    ('serialize', serialize_stage),
+]
+
+
+# The training steps print their progress and warnings (silenced by matcha.py), not part of the measure
+def quiet(function):
+    def run():
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return function()
+    return run
+
+
+# The date cleaning modifies its input: each run cleans a new copy
+def clean_dates_stage(opps):
+    return quiet(lambda: clean_date_columns(opps.copy(), DATE_COLUMNS))
+
+
+# Runs on the cleaned dates, as in matcha.py
+def extra_columns_stage(opps):
+    apps = training_applications(opps)
+    opps = quiet(lambda: clean_date_columns(opps.copy(), DATE_COLUMNS))()[0]
+    return quiet(lambda: extra_columns(opps, apps))
+
+
+# Parsing of the specifics, logistics and legal hstore strings into their features
+def hstore_stage(opps):
+    return lambda: (specifics_features(opps), logistics_features(opps))
+
+
+def expand_openings_stage(opps):
+    opps = expansion_input(opps)
+    return quiet(lambda: expand_openings(opps))
+
+
+def weighted_openings_stage(opps):
+    opps = expansion_input(opps)
+    return lambda: weighted_openings(opps)
+
+
+TRAINING_STAGES = [
+    ('clean_dates', clean_dates_stage),
+    ('extra_columns', extra_columns_stage),
+    ('hstore', hstore_stage),
+    ('expand_openings', expand_openings_stage),
+    ('weighted_openings', weighted_openings_stage),
+]
+
+
+# ----------------------- MEASURES --------------------------------###
+
+# Seconds per call of `function`: the best and the median of up to `repeat` measures, fewer if the measures would take
+# more than `budget` seconds. The first call warms up (caches, lazy imports) and sizes the measures, it is the only
+# measure of a stage slower than the budget.
+def measure(function, repeat, budget):
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+    if first >= budget:
+        return {'best_s': first, 'median_s': first, 'runs': 1, 'number': 1}
+    number = max(1, int(np.ceil(MIN_MEASURE_TIME / first))) if first > 0 else 1000
+    runs = max(1, min(repeat, int(budget / max(first * number, 1e-9))))
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return {'best_s': min(timings), 'median_s': float(np.median(timings)), 'runs': runs, 'number': number}
+
+
+def stage_key(stage, rows):
+    return stage + '@' + str(rows)
+
+
+def run_stages(stages, scoring_sizes, training_sizes, repeat, budget, seed):
+    results = {}
+    models = None
+    for rows in scoring_sizes:
+        payloads = None
+        for name, prepare in SCORING_STAGES:
+            if name not in stages:
+                continue
+            if models is None:
+                models = registry.get()
+            if payloads is None:
+                # the mix is rounded per kind of payload, a few more are drawn for the smallest sizes
+                payloads = payload_mix(rows + 10, seed=seed)[:rows]
+            results[stage_key(name, rows)] = dict(measure(prepare(payloads, models), repeat, budget), stage=name,
+                                                  rows=rows)
+            print(stage_key(name, rows), results[stage_key(name, rows)]['median_s'], file=sys.stderr)
+    for rows in training_sizes:
+        opps = None
+        for name, prepare in TRAINING_STAGES:
+            if name not in stages:
+                continue
+            if opps is None:
+                opps = training_opportunities(rows, seed)
+            results[stage_key(name, rows)] = dict(measure(prepare(opps), repeat, budget), stage=name, rows=rows)
+            print(stage_key(name, rows), results[stage_key(name, rows)]['median_s'], file=sys.stderr)
+    return results
+
+
+# Relative change of the median time of the stages measured in both reports, and the stages slower than the
+# baseline by more than `threshold`
+def compare_reports(report, baseline, threshold):
+    changes = {}
+    regressions = []
+    for key, result in sorted(report['results'].items()):
+        if key not in baseline['results']:
+            continue
+        old, new = baseline['results'][key]['median_s'], result['median_s']
+        changes[key] = round((new - old) / old, 4) if old else 0.0
+        if changes[key] > threshold:
+            regressions.append(key)
+    return {'baseline_commit': baseline.get('commit'), 'threshold': threshold, 'changes': changes,
+            'regressions': regressions}
+
+
+def print_comparison(report, baseline, comparison):
+    print('%-28s %14s %14s %9s' % ('stage@rows', 'baseline (ms)', 'current (ms)', 'change'))
+    for key, change in sorted(comparison['changes'].items()):
+        print('%-28s %14.4f %14.4f %8.1f%% %s' % (key, baseline['results'][key]['median_s'] * 1000,
+                                                 report['results'][key]['median_s'] * 1000, change * 100,
+                                                 'REGRESSION' if key in comparison['regressions'] else ''))
+
+
+def read_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Most recent report of the results directory
+def latest_report():
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')))
+    if not paths:
+        raise SystemExit("No report in " + RESULTS_DIR)
+    return paths[-1]
+
+
+def parse_sizes(text):
+    return [int(size) for size in text.split(',') if size.strip()]
+
+
+def main(argv=None):
+    stage_names = [name for name, prepare in SCORING_STAGES + TRAINING_STAGES]
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the scoring and training stages.")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser('run', help="Time the stages and write a report")
+    run.add_argument('--stages', default=','.join(stage_names), help="Stages to time: " + ', '.join(stage_names))
+    run.add_argument('--sizes', default=','.join(map(str, SCORING_SIZES)), help="Rows of the scoring stages")
+    run.add_argument('--training-sizes', default=','.join(map(str, TRAINING_SIZES)),
+                     help="Rows of the training stages")
+    run.add_argument('--repeat', type=int, default=5, help="Measures per stage and size")
+    run.add_argument('--budget', type=float, default=10, help="Seconds of measures per stage and size, at most")
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--output', help="JSON report file (a new file of " + RESULTS_DIR + " otherwise)")
+    run.add_argument('--compare', help="Baseline JSON report to compare with")
+    run.add_argument('--threshold', type=float, default=0.2,
+                     help="Relative slow down of a stage beyond which the comparison fails (exit code 1)")
+
+    compare = commands.add_parser('compare', help="Compare a report with a baseline report")
+    compare.add_argument('baseline', help="Baseline JSON report")
+    compare.add_argument('report', nargs='?', help="JSON report (the latest of " + RESULTS_DIR + " by default)")
+    compare.add_argument('--threshold', type=float, default=0.2,
+                         help="Relative slow down of a stage beyond which the comparison fails (exit code 1)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        report = read_report(args.report or latest_report())
+        baseline = read_report(args.baseline)
+    else:
+        stages = [name.strip() for name in args.stages.split(',')]
+        unknown = [name for name in stages if name not in stage_names]
+        if unknown:
+            parser.error("Unknown stages: " + ', '.join(unknown))
+        commit = git_commit()
+        report = {
+            'commit': commit,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                     'numpy': np.__version__, 'pandas': pd.__version__},
+            'config': {'repeat': args.repeat, 'budget_s': args.budget, 'seed': args.seed},
+            'results': run_stages(stages, parse_sizes(args.sizes), parse_sizes(args.training_sizes),
+                                  args.repeat, args.budget, args.seed),
+        }
+        output = args.output
+        if output is None:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            output = os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '-' + (commit or 'unknown')[:8] + '.json')
+        with open(output, 'w') as f:
+            f.write(json.dumps(report, indent=2) + '\n')
+        print("Report written to", output, file=sys.stderr)
+        if not args.compare:
+            return 0
+        baseline = read_report(args.compare)
+
+    comparison = compare_reports(report, baseline, args.threshold)
+    print_comparison(report, baseline, comparison)
+    return 1 if comparison['regressions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
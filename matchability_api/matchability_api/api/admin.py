@@ -1,3 +1,10 @@
 from django.contrib import admin
 
 # Register your models here.
+from matchability_api.api.models import TrainingJob
+
+
+@admin.register(TrainingJob)
+class TrainingJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'created_at', 'duration', 'peak_rss', 'model_version']
+    list_filter = ['status']
@@ -1,12 +1,18 @@
 from django.conf import settings
 from django_cron import CronJobBase, Schedule
 
+from matchability_api.api.training import run_next_training_job
+
 
 class TrainModel(CronJobBase):
-    RUN_EVERY_MINS = 1 if settings.DEBUG else 60
+    RUN_EVERY_MINS = settings.TRAINING_EVERY_MINS
 
     schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
     code = 'Update the Training Model'
 
+    # The training runs in its own process (see api/training.py), this process only waits for it
     def do(self):
-        exec(open("matchability_lib/matcha.py").read(), globals())
+        job = run_next_training_job()
+        if job is None:
+            return 'A training job is already running.'
+        return str(job) + ' ' + (job.model_version or job.error)
@@ -1,3 +1,32 @@
 from django.db import models
 
 # Create your models here.
+
+
+# A run of the training (matcha.py) in its own process, see api/training.py
+class TrainingJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # seconds
+    duration = models.FloatField(null=True, blank=True)
+    # bytes, maximum resident set size of the training process
+    peak_rss = models.BigIntegerField(null=True, blank=True)
+    return_code = models.IntegerField(null=True, blank=True)
+    # model version published by the job
+    model_version = models.CharField(max_length=64, blank=True)
+    log_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return 'Training job ' + str(self.pk) + ' (' + self.status + ')'
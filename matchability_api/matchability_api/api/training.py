@@ -0,0 +1,135 @@
+'''
+
+Matchability - Training Jobs
+Runs the training (matcha.py) in its own process, with a memory limit, a lower CPU priority and a timeout, and
+records each run as a TrainingJob. The API processes only see the new model once the training publishes it.
+
+'''
+
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists
+from django.utils import timezone
+
+from matchability_api.api.models import TrainingJob
+from matchability_lib.registry import read_version_token
+
+# Command of the training process, run from the matchability_api directory
+TRAINING_COMMAND = [sys.executable, '-m', 'matchability_lib.matcha']
+
+# Seconds between two checks of the training process
+TRAINING_POLL_INTERVAL = 1
+
+
+def read_published_version():
+    try:
+        return read_version_token(settings.MODEL_DIR)[0]
+    except (OSError, IOError):
+        return None
+
+
+# Applied in the training process before matcha.py starts
+def limit_training_process():
+    os.nice(settings.TRAINING_NICE)
+    if settings.TRAINING_MEMORY_LIMIT:
+        resource.setrlimit(resource.RLIMIT_AS, (settings.TRAINING_MEMORY_LIMIT, settings.TRAINING_MEMORY_LIMIT))
+
+
+def exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+# Waits for the training process and returns its exit code and resource usage (maximum resident set size...).
+# The whole process group is killed after `timeout` seconds, the exit code is then None.
+def wait_training_process(process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            process.returncode = exit_code(status)
+            return process.returncode, usage
+        time.sleep(TRAINING_POLL_INTERVAL)
+    os.killpg(process.pid, signal.SIGKILL)
+    pid, status, usage = os.wait4(process.pid, 0)
+    process.returncode = exit_code(status)
+    return None, usage
+
+
+# Jobs left running by a cron process that died (their process group was killed with it or timed out since)
+def fail_stale_jobs():
+    limit = timezone.now() - timedelta(seconds=settings.TRAINING_TIMEOUT + 60)
+    TrainingJob.objects.filter(status=TrainingJob.RUNNING, started_at__lt=limit).update(
+        status=TrainingJob.FAILED, error='Interrupted.', finished_at=timezone.now())
+
+
+# Claims a queued job with a single conditional UPDATE: it only succeeds while the job is still queued and no job is
+# running, so two cron runs can never both start a job
+def claim_training_job(job):
+    started_at = timezone.now()
+    running = TrainingJob.objects.filter(status=TrainingJob.RUNNING)
+    claimed = TrainingJob.objects.filter(pk=job.pk, status=TrainingJob.QUEUED) \
+        .annotate(busy=Exists(running)).filter(busy=False) \
+        .update(status=TrainingJob.RUNNING, started_at=started_at)
+    if claimed != 1:
+        return False
+    job.status = TrainingJob.RUNNING
+    job.started_at = started_at
+    return True
+
+
+# Runs a claimed training job to completion and records its outcome
+def run_training_job(job):
+    os.makedirs(settings.TRAINING_LOG_DIR, exist_ok=True)
+    job.log_file = os.path.join(settings.TRAINING_LOG_DIR, 'training_' + str(job.pk) + '.log')
+    job.save()
+
+    previous_version = read_published_version()
+    start = time.time()
+    try:
+        with open(job.log_file, 'w') as log:
+            # own session: the timeout kills matcha.py and everything it started
+            process = subprocess.Popen(TRAINING_COMMAND, cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+                                       preexec_fn=limit_training_process, start_new_session=True)
+            return_code, usage = wait_training_process(process, settings.TRAINING_TIMEOUT)
+        job.return_code = process.returncode
+        job.peak_rss = usage.ru_maxrss * 1024  # kilobytes on Linux
+        version = read_published_version()
+        if return_code is None:
+            job.error = 'Timed out after ' + str(settings.TRAINING_TIMEOUT) + ' seconds.'
+        elif return_code != 0:
+            job.error = 'Training exited with code ' + str(return_code) + ', see ' + job.log_file
+        elif version == previous_version:
+            job.error = 'No model version was published, see ' + job.log_file
+        else:
+            job.model_version = version
+        job.status = TrainingJob.FAILED if job.error else TrainingJob.SUCCEEDED
+    except Exception as e:
+        job.status = TrainingJob.FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.duration = time.time() - start
+    job.save()
+    return job
+
+
+# Runs the oldest queued job, queueing one if there is none. Nothing is run while another job is running: the job is
+# left queued if another cron run claims a job first.
+def run_next_training_job():
+    fail_stale_jobs()
+    if TrainingJob.objects.filter(status=TrainingJob.RUNNING).exists():
+        return None
+    job = TrainingJob.objects.filter(status=TrainingJob.QUEUED).order_by('created_at').first()
+    if job is None:
+        job = TrainingJob.objects.create()
+    if not claim_training_job(job):
+        return None
+    return run_training_job(job)
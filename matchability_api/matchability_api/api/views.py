@@ -1,15 +1,73 @@
 # Create your views here.
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from matchability_lib.matchability import matchability
+from matchability_lib.matchability import cache_stats, matchability, matchability_batch, matchability_stored, \
+    matchability_stream, metrics_text
+from matchability_lib.metrics import metrics, track_request, track_stream
 
 
 @api_view(['GET', 'POST'])
+@track_request('opportunity')
 def opportunity_matchability(request):
     if request.method == 'GET':
         return Response({"message": "Hello, world!"})
         # return Response(request.data)
     elif request.method == 'POST':
+        with metrics.timer('parse'):
+            res = request.data["data"]
+        return Response(matchability(res, explain=bool(request.data.get("explain"))))
+
+
+@api_view(['POST'])
+@track_request('opportunity_batch')
+def opportunity_matchability_batch(request):
+    with metrics.timer('parse'):
         res = request.data["data"]
-        return Response(matchability(res))
+    if not isinstance(res, list):
+        return Response({"status": "ERROR", "error": "'data' must be a list of opportunities."}, status=400)
+    return Response(matchability_batch(res, explain=bool(request.data.get("explain"))))
+
+
+# Full or partial opportunity of a given id: merged into its stored features and scored
+@api_view(['POST'])
+@track_request('opportunity_update')
+def opportunity_matchability_update(request, opportunity_id):
+    with metrics.timer('parse'):
+        res = request.data["data"]
+    if not isinstance(res, dict):
+        return Response({"status": "ERROR", "error": "'data' must be an opportunity."}, status=400)
+    return Response(matchability_stored(opportunity_id, res))
+
+
+# Re-scores an opportunity from its stored features
+@api_view(['POST'])
+@track_request('opportunity_rescore')
+def opportunity_matchability_rescore(request, opportunity_id):
+    res = matchability_stored(opportunity_id)
+    if res is None:
+        return Response({"status": "ERROR", "error": "Unknown opportunity: " + str(opportunity_id)}, status=404)
+    return Response(res)
+
+
+# Newline-delimited JSON opportunities in, newline-delimited JSON results out. A plain Django view: the body is read
+# line by line while the results are streamed back, instead of being parsed at once by DRF.
+@csrf_exempt
+@require_POST
+def opportunity_matchability_stream(request):
+    return StreamingHttpResponse(track_stream('opportunity_stream', matchability_stream(request)),
+                                 content_type='application/x-ndjson')
+
+
+# Hit/miss/eviction counters of this process' prediction and skills cluster caches
+@api_view(['GET'])
+def opportunity_cache_stats(request):
+    return Response(cache_stats())
+
+
+# Latency histograms and counters of this process, in the Prometheus text format
+def opportunity_metrics(request):
+    return HttpResponse(metrics_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -121,3 +121,74 @@ CRON_CLASSES = [
     'matchability_api.api.cron.TrainModel'
 
 ]
+
+# Matchability model artifacts
+# Each training run publishes its artifacts under MODEL_DIR/<version>/ and then points MODEL_DIR/VERSION at it.
+
+MODEL_DIR = os.path.join(BASE_DIR, 'matchability_lib', 'pickles')
+
+# Seconds between two checks for a newly published model version
+MODEL_RELOAD_INTERVAL = 5
+
+# Number of published model versions kept on disk
+MODEL_KEEP_VERSIONS = 3
+
+# Prediction cache of the unchanged opportunities (per process, entries expire after PREDICTION_CACHE_TTL seconds)
+PREDICTION_CACHE_SIZE = 10000
+PREDICTION_CACHE_TTL = 6 * 3600
+
+# SQLite file of a prediction cache shared by all the API processes of the server, None to only cache per process
+PREDICTION_CACHE_PATH = None
+
+# Micro-batching of the async scoring server (matcha_asgi.py): concurrent requests are scored together, in
+# batches of at most ASYNC_MAX_BATCH_SIZE opportunities, waiting at most ASYNC_MAX_WAIT_MS for a batch to fill up
+ASYNC_MAX_BATCH_SIZE = 64
+ASYNC_MAX_WAIT_MS = 5
+# Threads scoring the batches (batches scored at the same time)
+ASYNC_SCORING_THREADS = 2
+
+# Load the model when the WSGI application is created (wsgi.py), i.e. once in the uwsgi master before it forks
+# the workers, which then start with the model in copy-on-write shared memory
+MODEL_PRELOAD = True
+
+# Directory of a shared memory filesystem where the forest of each model version is kept once for all the API
+# processes (also across reloads), mapped read-only. None to give every process its own copy of the forest.
+MODEL_SHARED_DIR = '/dev/shm/matchability' if os.path.isdir('/dev/shm') else None
+
+# Verify the checksums of the model bundle files when loading a model version
+MODEL_BUNDLE_VERIFY = True
+
+# Opt-in: rebuild the native scikit-learn trees of the Random Forest from the model bundle, a faster traversal on big
+# batches for a private copy of the tree nodes in each process (through private scikit-learn structures, tied to its
+# version). By default the forest is evaluated straight from the shared memory maps, with the NumPy traversal.
+MODEL_NATIVE_TREES = False
+
+# Number of skills texts whose cluster is cached per model version
+CLUSTER_CACHE_SIZE = 4096
+
+# Streaming endpoint (api/opportunity/stream): opportunities scored together, and maximum size in bytes of an
+# opportunity (one line of the request body)
+STREAM_CHUNK_SIZE = 256
+STREAM_MAX_LINE_SIZE = 1024 * 1024
+
+# Retraining (api/cron.py): every TRAINING_EVERY_MINS minutes, matcha.py runs in a separate process at a lower CPU
+# priority (TRAINING_NICE), with at most TRAINING_MEMORY_LIMIT bytes of address space (None for no limit), and is
+# killed after TRAINING_TIMEOUT seconds. Its output is written to a log file per job in TRAINING_LOG_DIR.
+TRAINING_EVERY_MINS = 60
+TRAINING_NICE = 10
+TRAINING_MEMORY_LIMIT = 8 * 1024 ** 3
+TRAINING_TIMEOUT = 2 * 3600
+TRAINING_LOG_DIR = os.path.join(BASE_DIR, 'matchability_lib', 'Resources', 'training_logs')
+
+# SQLite file of the feature store: model fields, feature values and skills cluster of the opportunities scored by id
+# (api/opportunity/<id>), re-scored from their stored features
+FEATURE_STORE_PATH = os.path.join(BASE_DIR, 'matchability_lib', 'Data', 'feature_store.sqlite3')
+
+# Popular season of the training feature hot_days_intersection (matchability_lib/training.py): HOT_SEASON_DAYS days
+# from the (month, day) HOT_SEASON_START of the year the experience starts
+HOT_SEASON_START = (7, 1)
+HOT_SEASON_DAYS = 31
+
+# Train on one row per opening (the former expansion of the opportunities) instead of at most two rows per opportunity
+# weighted by their number of openings, to validate the weighted training against it
+TRAINING_EXPAND_OPENINGS = False
@@ -19,12 +19,20 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
 
-from matchability_api.api.views import opportunity_matchability
+from matchability_api.api.views import opportunity_matchability, opportunity_matchability_batch, \
+    opportunity_matchability_stream, opportunity_matchability_update, opportunity_matchability_rescore, \
+    opportunity_cache_stats, opportunity_metrics
 
 router = routers.DefaultRouter()
 
 urlpatterns = [
     path('api/opportunity', opportunity_matchability),
+    path('api/opportunity/batch', opportunity_matchability_batch),
+    path('api/opportunity/stream', opportunity_matchability_stream),
+    path('api/opportunity/<int:opportunity_id>', opportunity_matchability_update),
+    path('api/opportunity/<int:opportunity_id>/rescore', opportunity_matchability_rescore),
+    path('api/cache/stats', opportunity_cache_stats),
+    path('api/metrics', opportunity_metrics),
     url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     url(r'^', include(router.urls)),
     url(r'^admin/', admin.site.urls),
@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 """
 
+import gc
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,20 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'matchability_api.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.MODEL_PRELOAD:
+    from matchability_lib.registry import registry  # noqa: E402
+
+    # load the model in the master process, before the workers are forked. If it can not be loaded, the server still
+    # starts and each process loads the model on its first request.
+    try:
+        registry.get()
+    except Exception as e:
+        print("Failed to preload the model, it will be loaded on the first request. Error is:", e)
+    else:
+        # keep the preloaded objects out of the garbage collector's passes, which would write to (and so copy) the
+        # pages shared with the workers
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
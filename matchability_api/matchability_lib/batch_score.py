@@ -0,0 +1,185 @@
+'''
+
+Matchability - Batch Scoring
+Scores a file of opportunities (CSV or Parquet, e.g. the aiesec_opportunities_extracted.csv of the training) in
+chunks, spread over a pool of processes which each load the model once. From the matchability_api directory:
+
+    python -m matchability_lib.batch_score matchability_lib/Data/aiesec_opportunities_extracted.csv scores.parquet
+
+'''
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from matchability_api.settings import MODEL_DIR
+from matchability_lib.bundle import MANIFEST_FILE
+from matchability_lib.matchability import predict
+from matchability_lib.registry import ModelSnapshot, read_version_token
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Opportunities per chunk sent to a worker
+BATCH_CHUNK_SIZE = 10000
+
+# Columns of the input copied to the output, when present, to identify the scored opportunities
+BATCH_KEEP_COLUMNS = ['opportunity_id', 'id']
+
+# Model snapshot of a worker process, loaded once by init_worker()
+worker_models = None
+
+
+def is_parquet(path):
+    return path.endswith('.parquet') or path.endswith('.parq')
+
+
+def require_pyarrow():
+    if pq is None:
+        raise RuntimeError("Reading or writing Parquet files requires pyarrow (pip install pyarrow).")
+
+
+# Chunks of at most `chunk_size` rows of the input file
+def read_chunks(path, chunk_size):
+    if is_parquet(path):
+        require_pyarrow()
+        parquet_file = pq.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            frame = parquet_file.read_row_group(i).to_pandas()
+            for start in range(0, len(frame), chunk_size):
+                yield frame.iloc[start:start + chunk_size]
+    else:
+        for frame in pd.read_csv(path, chunksize=chunk_size, low_memory=False):
+            yield frame
+
+
+# Writes the scored chunks one after the other: Parquet (one row group per chunk) or CSV
+class ChunkWriter(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = is_parquet(path)
+        if self.parquet:
+            require_pyarrow()
+        self._writer = None
+        self._header = True
+
+    def write(self, frame):
+        if self.parquet:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+# Version directory of the model to use: the one of the given model bundle (<version>/bundle, or <version> itself), or
+# the active version of the model directory
+def model_location(bundle=None, model_dir=MODEL_DIR):
+    if bundle:
+        path = os.path.abspath(bundle.rstrip('/'))
+        if os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+            path = os.path.dirname(path)
+        return os.path.basename(path), os.path.dirname(path)
+    return read_version_token(model_dir)[0], model_dir
+
+
+def init_worker(version, model_dir):
+    global worker_models
+    worker_models = ModelSnapshot.load(version, model_dir)
+
+
+# Scores a chunk of opportunities in a worker. If the chunk can not be featurized at once, the opportunities are
+# featurized one by one and the faulty ones get an error instead of a score.
+def score_chunk(frame, keep_columns):
+    models = worker_models
+    result = frame[[name for name in keep_columns if name in frame]].reset_index(drop=True)
+    errors = [None] * len(frame)
+    try:
+        x_data = models.featurizer.transform(frame)
+    except Exception:
+        x_data = np.zeros((len(frame), len(models.features)))
+        for i, d in enumerate(frame.to_dict('records')):
+            try:
+                x_data[i] = models.featurizer.transform_row(d)
+            except Exception as e:
+                errors[i] = str(e)
+
+    prob, output = predict(x_data, models)
+    failed = np.array([error is not None for error in errors], dtype=bool)
+    result['value'] = np.where(failed, np.nan, prob)
+    result['output'] = output & ~failed
+    result['error'] = errors
+    result['model_version'] = models.version
+    return result
+
+
+# Scores the input file into the output file, keeping at most 2 chunks per worker in flight.
+# Returns the number of rows scored.
+def score_file(input_path, output_path, bundle=None, workers=None, chunk_size=BATCH_CHUNK_SIZE,
+               keep_columns=BATCH_KEEP_COLUMNS):
+    version, model_dir = model_location(bundle)
+    workers = workers or os.cpu_count() or 1
+    writer = ChunkWriter(output_path)
+    rows = 0
+    start = time.time()
+    try:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(version, model_dir)) as executor:
+            pending = deque()
+            for frame in read_chunks(input_path, chunk_size):
+                pending.append(executor.submit(score_chunk, frame, keep_columns))
+                if len(pending) >= 2 * workers:
+                    rows += write_result(writer, pending.popleft(), rows, start)
+            while pending:
+                rows += write_result(writer, pending.popleft(), rows, start)
+    finally:
+        writer.close()
+
+    elapsed = time.time() - start
+    print("Scored", rows, "rows with model version", version, "in", round(elapsed, 2), "s -",
+          int(rows / elapsed) if elapsed else rows, "rows/s", file=sys.stderr)
+    return rows
+
+
+def write_result(writer, future, rows, start):
+    result = future.result()
+    writer.write(result)
+    rows += len(result)
+    elapsed = time.time() - start
+    print(rows, "rows scored -", int(rows / elapsed) if elapsed else rows, "rows/s", file=sys.stderr)
+    return len(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scores a CSV or Parquet file of opportunities.")
+    parser.add_argument('input', help="CSV or Parquet (.parquet) file of opportunities")
+    parser.add_argument('output', help="Scores file, Parquet (.parquet) or CSV")
+    parser.add_argument('--bundle', help="Model bundle directory (pickles/<version>/bundle) or its model version "
+                                         "directory (default: the active version of MODEL_DIR)")
+    parser.add_argument('--workers', type=int, default=None, help="Scoring processes (default: one per CPU)")
+    parser.add_argument('--chunk-size', type=int, default=BATCH_CHUNK_SIZE, help="Opportunities per chunk")
+    parser.add_argument('--keep', default=','.join(BATCH_KEEP_COLUMNS),
+                        help="Comma separated input columns copied to the output (when present)")
+    args = parser.parse_args(argv)
+    score_file(args.input, args.output, bundle=args.bundle, workers=args.workers, chunk_size=args.chunk_size,
+               keep_columns=[name for name in args.keep.split(',') if name])
+
+
+if __name__ == '__main__':
+    main()
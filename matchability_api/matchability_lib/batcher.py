@@ -0,0 +1,110 @@
+'''
+
+Matchability - Micro-batching
+Coalesces the opportunities of concurrent requests into batches scored together in a worker thread.
+
+'''
+
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from matchability_api.settings import ASYNC_MAX_BATCH_SIZE, ASYNC_MAX_WAIT_MS, ASYNC_SCORING_THREADS
+
+
+# Queues the submitted items and scores them in batches with `score_batch(items) --> results` (one result per
+# item, in order). A batch is closed as soon as it holds `max_batch_size` items or `max_wait_ms` after its
+# first item. While all the scoring threads are busy, the incoming items wait in the queue for the next batch.
+class MicroBatcher(object):
+
+    def __init__(self, score_batch, max_batch_size=ASYNC_MAX_BATCH_SIZE, max_wait_ms=ASYNC_MAX_WAIT_MS,
+                 threads=ASYNC_SCORING_THREADS):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.threads = threads
+        self.batch_sizes = Counter()
+        self.failed_batches = 0
+        self._queue = None
+        self._slots = None
+        self._executor = None
+        self._task = None
+
+    # Starts the batching task, must be called from the event loop serving the requests
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.threads)
+            self._executor = ThreadPoolExecutor(self.threads)
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._executor.shutdown(wait=False)
+            self._task = None
+
+    # Scores one item with the next batch, returns its result
+    async def submit(self, item):
+        self.start()
+        future = asyncio.get_event_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                # the items already queued always join the batch, new ones until the deadline
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.ensure_future(self._score(batch))
+
+    async def _score(self, batch):
+        try:
+            results = await asyncio.get_event_loop().run_in_executor(
+                self._executor, self.score_batch, [item for item, future in batch])
+        except Exception as e:
+            self.failed_batches += 1
+            for item, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        self.batch_sizes[len(batch)] += 1
+        for (item, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        items = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'threads': self.threads,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'batches': batches,
+            'failed_batches': self.failed_batches,
+            'requests': items,
+            'mean_batch_size': float(items) / batches if batches else 0.0,
+            # number of batches scored for each batch size
+            'batch_size_histogram': dict((str(size), self.batch_sizes[size]) for size in sorted(self.batch_sizes)),
+        }
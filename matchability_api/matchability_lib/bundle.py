@@ -0,0 +1,138 @@
+'''
+
+Matchability - Model Bundle
+Versioned format of the trained model artifacts: a manifest (feature order, settings, checksums) and one .npy
+file per array, memory-mapped read-only when serving. Nothing is unpickled to load a bundle.
+
+'''
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+from matchability_api.settings import MODEL_BUNDLE_VERIFY, MODEL_NATIVE_TREES
+from matchability_lib.clustering import NearestCentroid, TfidfEncoder
+from matchability_lib.forest import CompiledForest
+
+BUNDLE_FORMAT = 1
+
+# Bundle directory, inside the directory of a model version
+BUNDLE_DIR = 'bundle'
+
+MANIFEST_FILE = 'manifest.json'
+
+FOREST_PREFIX = 'forest_'
+
+# TfidfVectorizer settings the bundle can reproduce, with the values it must have for the others
+TFIDF_SETTINGS = ['lowercase', 'token_pattern', 'norm', 'use_idf', 'sublinear_tf', 'binary']
+TFIDF_REQUIRED = {'analyzer': 'word', 'ngram_range': (1, 1), 'stop_words': None, 'strip_accents': None,
+                  'preprocessor': None, 'tokenizer': None}
+
+
+def bundle_dir(path):
+    return os.path.join(path, BUNDLE_DIR)
+
+
+def has_bundle(path):
+    return os.path.isfile(os.path.join(bundle_dir(path), MANIFEST_FILE))
+
+
+def file_checksum(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+# Writes the bundle of a trained model in the directory `path` of its version
+def write_bundle(path, version, vectorizer, kmeans, cluster_terms, features, forest):
+    params = vectorizer.get_params()
+    unsupported = [name for name, value in TFIDF_REQUIRED.items() if params.get(name) != value]
+    if unsupported:
+        raise ValueError("Vectorizer settings not supported by the model bundle: " + ', '.join(unsupported))
+
+    arrays = dict((FOREST_PREFIX + name, array) for name, array in CompiledForest.from_sklearn(forest).arrays().items())
+    arrays['tfidf_vocabulary'] = np.array(sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get))
+    if vectorizer.use_idf:
+        arrays['tfidf_idf'] = np.asarray(vectorizer.idf_, dtype=np.float64)
+    arrays['kmeans_centers'] = np.asarray(kmeans.cluster_centers_, dtype=np.float64)
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'created_at': str(datetime.now()),
+        'features': [str(feature) for feature in features],
+        'cluster_terms': [str(term) for term in cluster_terms],
+        'tfidf': dict((name, params[name]) for name in TFIDF_SETTINGS),
+        'arrays': {},
+    }
+
+    # written aside and renamed at the end: a bundle directory is always complete
+    tmp_path = bundle_dir(path) + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_path, name + '.npy'), array, allow_pickle=False)
+        manifest['arrays'][name] = {
+            'file': name + '.npy',
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'sha256': file_checksum(os.path.join(tmp_path, name + '.npy')),
+        }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(bundle_dir(path), ignore_errors=True)
+    os.rename(tmp_path, bundle_dir(path))
+
+
+# A model bundle opened for serving: every array is a read-only memory map of its file, so the pages are loaded
+# on demand and shared by all the processes of the server
+class ModelBundle(object):
+
+    def __init__(self, manifest, arrays):
+        self.manifest = manifest
+        self.arrays = arrays
+        self.version = manifest['version']
+        self.features = manifest['features']
+        self.cluster_terms = manifest['cluster_terms']
+
+    @classmethod
+    def open(cls, path, verify=MODEL_BUNDLE_VERIFY):
+        path = bundle_dir(path)
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError("Unsupported model bundle format: " + str(manifest.get('format')))
+
+        arrays = {}
+        for name, info in manifest['arrays'].items():
+            filename = os.path.join(path, info['file'])
+            if verify and file_checksum(filename) != info['sha256']:
+                raise ValueError("Checksum mismatch for " + filename)
+            array = np.load(filename, mmap_mode='r', allow_pickle=False)
+            if array.dtype.str != info['dtype'] or list(array.shape) != info['shape']:
+                raise ValueError("Unexpected dtype or shape for " + filename)
+            arrays[name] = array
+        return cls(manifest, arrays)
+
+    def forest(self, native=MODEL_NATIVE_TREES):
+        forest = CompiledForest.from_arrays(dict((name[len(FOREST_PREFIX):], array)
+                                                 for name, array in self.arrays.items()
+                                                 if name.startswith(FOREST_PREFIX)))
+        return forest.with_native_trees(len(self.features)) if native else forest
+
+    def vectorizer(self):
+        settings = self.manifest['tfidf']
+        return TfidfEncoder(self.arrays['tfidf_vocabulary'].tolist(),
+                            idf=self.arrays['tfidf_idf'] if settings['use_idf'] else None,
+                            lowercase=settings['lowercase'], token_pattern=settings['token_pattern'],
+                            norm=settings['norm'], sublinear_tf=settings['sublinear_tf'], binary=settings['binary'])
+
+    def kmeans(self):
+        return NearestCentroid(self.arrays['kmeans_centers'])
@@ -0,0 +1,154 @@
+'''
+
+Matchability - Prediction Cache
+Caches the predictions of unchanged opportunities, so re-scoring them does not run the whole model again.
+
+'''
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from matchability_api.settings import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_PATH
+from matchability_lib.featurizer import COLUMN_ALIASES, FEATURE_GROUPS, SKILL_FIELDS
+
+# Every payload field read by the featurizer: a change to any other field does not change the prediction
+CACHE_FIELDS = set(SKILL_FIELDS)
+for group in FEATURE_GROUPS:
+    CACHE_FIELDS.update(group.fields)
+CACHE_FIELDS.update(alias for alias, name in COLUMN_ALIASES.items() if name in CACHE_FIELDS)
+CACHE_FIELDS = sorted(CACHE_FIELDS)
+
+
+# Key of an opportunity's prediction: hash of the fields read by the featurizer and of the model version,
+# so the predictions of a previous model are never served after a reload
+def prediction_key(d, version):
+    fields = dict((field, d[field]) for field in CACHE_FIELDS if field in d)
+    canonical = json.dumps([str(version), fields], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+# Cache shared by all the API processes of the server, stored in a local SQLite file
+class SqliteCacheBackend(object):
+
+    def __init__(self, path, ttl=PREDICTION_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS predictions '
+                       '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+
+    # one connection per thread, sqlite connections cannot be shared between threads
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=1)
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        row = self._connection().execute('SELECT value, expires FROM predictions WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return tuple(json.loads(row[0]))
+
+    def set(self, key, value):
+        with self._connection() as db:
+            db.execute('INSERT OR REPLACE INTO predictions (key, value, expires) VALUES (?, ?, ?)',
+                       (key, json.dumps(value), time.time() + self.ttl))
+
+    # Drops the expired predictions, returns how many were dropped
+    def purge(self):
+        with self._connection() as db:
+            return db.execute('DELETE FROM predictions WHERE expires < ?', (time.time(),)).rowcount
+
+
+# In-process LRU cache of the predictions with a time to live, optionally backed by a shared backend
+# checked on a local miss. Values are (probability, output) tuples.
+class PredictionCache(object):
+
+    def __init__(self, max_size=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL, backend=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend_errors = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] >= time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self.expirations += 1
+
+        value = self._backend_call('get', key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.backend_hits += 1
+            self._store(key, value)
+        return value
+
+    def set(self, key, value):
+        value = (float(value[0]), bool(value[1]))
+        with self._lock:
+            self._store(key, value)
+        self._backend_call('set', key, value)
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # the shared backend is only an optimization: if it fails, predictions are computed as without it
+    def _backend_call(self, method, *args):
+        if self.backend is None:
+            return None
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            with self._lock:
+                self.backend_errors += 1
+            print("Prediction cache backend error:", e)
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.backend_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'backend_hits': self.backend_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'backend_errors': self.backend_errors,
+                'hit_rate': float(self.hits + self.backend_hits) / lookups if lookups else 0.0,
+            }
+
+
+prediction_cache = PredictionCache(
+    backend=SqliteCacheBackend(PREDICTION_CACHE_PATH) if PREDICTION_CACHE_PATH else None)
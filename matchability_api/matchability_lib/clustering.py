@@ -0,0 +1,177 @@
+'''
+
+Matchability - Skills Clustering
+TF-IDF encoding of the skills text and nearest k-means centroid, computed from the arrays of the model bundle.
+
+'''
+
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+
+from matchability_api.settings import CLUSTER_CACHE_SIZE
+
+# Default tokenization of scikit-learn's text vectorizers: words of 2 or more alphanumeric characters
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+
+# Same transform as the fitted TfidfVectorizer (word unigrams) it was exported from, see bundle.write_bundle()
+class TfidfEncoder(object):
+
+    def __init__(self, vocabulary, idf=None, lowercase=True, token_pattern=DEFAULT_TOKEN_PATTERN, norm='l2',
+                 sublinear_tf=False, binary=False):
+        self.vocabulary = dict((term, j) for j, term in enumerate(vocabulary))
+        self.idf = idf
+        self.lowercase = lowercase
+        self.token_pattern = token_pattern
+        self.tokenize = re.compile(token_pattern).findall
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+        self.binary = binary
+
+    # Term counts of the texts, CSR arrays with the terms of each row sorted
+    def count(self, texts):
+        indptr = [0]
+        indices = []
+        counts = []
+        for text in texts:
+            if self.lowercase:
+                text = text.lower()
+            row = {}
+            for token in self.tokenize(text):
+                j = self.vocabulary.get(token)
+                if j is not None:
+                    row[j] = row.get(j, 0) + 1
+            for j in sorted(row):
+                indices.append(j)
+                counts.append(row[j])
+            indptr.append(len(indices))
+        return (np.array(counts, dtype=np.float64), np.array(indices, dtype=np.int32),
+                np.array(indptr, dtype=np.int32))
+
+    # TF-IDF weights of the texts, CSR arrays
+    def weights(self, texts):
+        data, indices, indptr = self.count(texts)
+        if self.binary:
+            data[:] = 1
+        if self.sublinear_tf:
+            np.log(data, data)
+            data += 1
+        if self.idf is not None:
+            data *= self.idf[indices]
+
+        if self.norm is not None:
+            rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            # bincount adds the values of a row one after the other, like scikit-learn's row normalization
+            if self.norm == 'l2':
+                norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=len(indptr) - 1))
+            else:
+                norms = np.bincount(rows, weights=np.abs(data), minlength=len(indptr) - 1)
+            norms[norms == 0] = 1
+            data /= norms[rows]
+        return data, indices, indptr
+
+    # TF-IDF matrix of the texts (sparse, one row per text)
+    def transform(self, texts):
+        data, indices, indptr = self.weights(texts)
+        return sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(self.vocabulary)))
+
+
+# Assigns each row to its closest k-means centroid, like KMeans.predict
+class NearestCentroid(object):
+
+    def __init__(self, centers):
+        self.cluster_centers_ = centers
+        self.center_norms = np.einsum('ij,ij->i', centers, centers)
+        # one row of centroid coordinates per term: the few terms of a text are gathered together
+        self.term_centers = np.ascontiguousarray(centers.T)
+
+    # argmin of the squared distances |x|^2 - 2 x.c + |c|^2, where |x|^2 is the same for all the centroids
+    def predict(self, x_data):
+        return np.argmin(self.center_norms - 2 * np.asarray(x_data.dot(self.term_centers)), axis=1)
+
+    # Cluster of a single sparse row given by its weights and term indices
+    def predict_row(self, data, indices):
+        return int(np.argmin(self.center_norms - 2 * data.dot(self.term_centers[indices])))
+
+
+# Skills text --> cluster assignment with an LRU cache: the skills come from a small controlled vocabulary, so the
+# same combinations keep coming back. The texts are normalized (lower case, sorted words) before the lookup.
+class ClusterAssigner(object):
+
+    def __init__(self, vectorizer, kmeans, cache_size=CLUSTER_CACHE_SIZE):
+        self.vectorizer = vectorizer
+        self.kmeans = kmeans
+        self.cache_size = cache_size
+        # single texts skip the sparse matrix when the vectorizer and k-means come from a model bundle
+        self.fast_path = isinstance(vectorizer, TfidfEncoder) and isinstance(kmeans, NearestCentroid)
+        # the order of the words does not matter as long as a token never spans several words
+        self.sort_words = getattr(vectorizer, 'token_pattern', None) == DEFAULT_TOKEN_PATTERN
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, text):
+        if getattr(self.vectorizer, 'lowercase', True):
+            text = text.lower()
+        if self.sort_words:
+            return ' '.join(sorted(text.split()))
+        return text
+
+    def _lookup(self, key):
+        with self._lock:
+            label = self._cache.get(key)
+            if label is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return label
+
+    def _store(self, key, label):
+        with self._lock:
+            self._cache[key] = label
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # Cluster of a single skills text
+    def assign_one(self, text):
+        key = self.normalize(text)
+        label = self._lookup(key)
+        if label is None:
+            if self.fast_path:
+                data, indices, indptr = self.vectorizer.weights([key])
+                label = self.kmeans.predict_row(data, indices)
+            else:
+                label = int(self.kmeans.predict(self.vectorizer.transform([key]))[0])
+            self._store(key, label)
+        return label
+
+    # Clusters of a batch of skills texts, the texts missing from the cache are assigned together
+    def assign(self, texts):
+        keys = [self.normalize(text) for text in texts]
+        labels = {}
+        for key in keys:
+            if key not in labels:
+                labels[key] = self._lookup(key)
+        missing = [key for key, label in labels.items() if label is None]
+        if missing:
+            for key, label in zip(missing, self.kmeans.predict(self.vectorizer.transform(missing))):
+                labels[key] = int(label)
+                self._store(key, labels[key])
+        return np.array([labels[key] for key in keys], dtype=int)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'max_size': self.cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,90 @@
+'''
+
+Matchability - Dates
+Fast parsing of the opportunity dates: fixed format first, general purpose parser as a fallback.
+
+'''
+
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Format of the dates sent by the API and extracted from the database
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+NAT = np.datetime64('NaT', 'ns')
+
+# Range of the datetime64[ns] values
+MIN_DATE = pd.Timestamp.min.ceil('s').to_pydatetime()
+MAX_DATE = pd.Timestamp.max.floor('s').to_pydatetime()
+
+# Batches up to this size are parsed value by value through the cache, bigger ones column-wise
+CACHED_PARSE_MAX_ROWS = 64
+
+DATE_CACHE_SIZE = 8192
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date_string(value):
+    value = value.strip()
+    if not value:
+        return NAT
+    try:
+        parsed = datetime.strptime(value, DATE_FORMAT)
+    except ValueError:
+        parsed = None
+    if parsed is not None:
+        # out of the datetime64[ns] range (0015-06-01...), would silently wrap around
+        if not MIN_DATE <= parsed <= MAX_DATE:
+            return NAT
+        return np.datetime64(parsed, 'ns')
+    # not in the expected format, let pandas figure it out
+    try:
+        timestamp = pd.Timestamp(value)
+    except (ValueError, OverflowError):
+        return NAT
+    if timestamp is pd.NaT:
+        return NAT
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+    return timestamp.to_datetime64()
+
+
+# Parses a single date (string, timestamp or missing value), NaT if it cannot be parsed
+def parse_date(value):
+    if isinstance(value, str):
+        return parse_date_string(value)
+    if value is None or value != value:
+        return NAT
+    try:
+        return parse_date_string(str(pd.Timestamp(value)))
+    except (ValueError, TypeError, OverflowError):
+        return NAT
+
+
+# Parses a column of dates into a datetime64[ns] array, NaT where the date cannot be parsed
+def parse_date_column(values):
+    if len(values) <= CACHED_PARSE_MAX_ROWS:
+        return np.array([parse_date(value) for value in values], dtype='datetime64[ns]')
+
+    values = pd.Series(values)
+    parsed = pd.to_datetime(values, format=DATE_FORMAT, errors='coerce').values.copy()
+    # only the values not in the expected format go through the slow path
+    retry = np.isnat(parsed) & values.notnull().values
+    if retry.any():
+        parsed[retry] = [parse_date(value) for value in values.values[retry]]
+    return parsed
+
+
+# Number of days from date2 to date1, 0 when one of them is missing
+def days_between(date1, date2):
+    diff = (date1 - date2) / np.timedelta64(1, 'D')
+    return np.where(np.isnan(diff), 0, diff)
+
+
+# Ratio of the year completed at the given dates: January --> 0, December --> 0.92
+def year_completion_ratio(dates):
+    months = dates.astype('datetime64[M]').astype(np.int64) % 12
+    return np.where(np.isnat(dates), 0, np.round(months / 12, 2))
@@ -0,0 +1,137 @@
+'''
+
+Matchability - Feature Store
+Keeps the raw model fields, the base feature values and the skills cluster of each opportunity in a local SQLite
+file, with a fingerprint of the source fields of each feature group. An opportunity is re-scored by id from its
+stored features, and an update only recomputes the feature groups whose source fields changed.
+
+'''
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from matchability_api.settings import FEATURE_STORE_PATH
+from matchability_lib.cache import CACHE_FIELDS
+from matchability_lib.featurizer import COLUMN_ALIASES, FEATURE_GROUPS, SKILL_FIELDS, row_features, row_value
+
+# Pseudo feature group of the skills cluster, computed from the skills fields by the model's TF-IDF + k-means
+CLUSTERS_GROUP = 'clusters'
+
+
+# Fingerprint of the values of some fields of a payload
+def fields_fingerprint(d, fields):
+    values = [row_value(d, field) for field in fields]
+    canonical = json.dumps(values, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+# Fingerprint of the source fields of every feature group
+def group_fingerprints(d):
+    fingerprints = dict((group.name, fields_fingerprint(d, group.fields)) for group in FEATURE_GROUPS)
+    fingerprints[CLUSTERS_GROUP] = fields_fingerprint(d, SKILL_FIELDS)
+    return fingerprints
+
+
+# Model fields of a payload, under the featurizer's names (the API aliases are renamed)
+def model_fields(d):
+    fields = {}
+    for field, value in d.items():
+        field = COLUMN_ALIASES.get(field, field)
+        if field in CACHE_FIELDS:
+            fields[field] = value
+    return fields
+
+
+# Stored features of an opportunity
+class StoredFeatures(object):
+
+    def __init__(self, fields, fingerprints, values, cluster, cluster_version):
+        self.fields = fields
+        self.fingerprints = fingerprints
+        self.values = values
+        self.cluster = cluster
+        self.cluster_version = cluster_version
+
+
+class FeatureStore(object):
+
+    def __init__(self, path=FEATURE_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    # one connection per thread, sqlite connections cannot be shared between threads
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('CREATE TABLE IF NOT EXISTS opportunity_features '
+                       '(opportunity_id INTEGER PRIMARY KEY, fields TEXT NOT NULL, fingerprints TEXT NOT NULL, '
+                       'features TEXT NOT NULL, cluster INTEGER, cluster_version TEXT, updated_at REAL NOT NULL)')
+            self._local.db = db
+        return db
+
+    def _read(self, db, opportunity_id):
+        row = db.execute('SELECT fields, fingerprints, features, cluster, cluster_version FROM opportunity_features '
+                         'WHERE opportunity_id = ?', (opportunity_id,)).fetchone()
+        if row is None:
+            return None
+        return StoredFeatures(json.loads(row[0]), json.loads(row[1]), json.loads(row[2]), row[3], row[4])
+
+    def _write(self, db, opportunity_id, stored):
+        db.execute('INSERT OR REPLACE INTO opportunity_features '
+                   '(opportunity_id, fields, fingerprints, features, cluster, cluster_version, updated_at) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   (opportunity_id, json.dumps(stored.fields, default=str), json.dumps(stored.fingerprints),
+                    json.dumps(stored.values), stored.cluster, stored.cluster_version, time.time()))
+
+    def get(self, opportunity_id):
+        return self._read(self._connection(), opportunity_id)
+
+    # Merges the (full or partial) payload `d` into the stored fields of an opportunity and recomputes the feature
+    # groups whose source fields changed, and the skills cluster if they changed or if it was assigned by another
+    # model version. `require_stored` only refreshes an opportunity already in the store (None if unknown).
+    # Returns the model input vector and the names of the recomputed groups.
+    def update(self, opportunity_id, d, models, require_stored=False):
+        featurizer = models.featurizer
+        db = self._connection()
+        # the read-modify-write of an opportunity is not interleaved with another process' update
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            stored = self._read(db, opportunity_id)
+            if stored is None:
+                if require_stored:
+                    db.execute('ROLLBACK')
+                    return None
+                stored = StoredFeatures({}, {}, {}, None, None)
+
+            fields = dict(stored.fields)
+            fields.update(model_fields(d))
+            fingerprints = group_fingerprints(fields)
+            changed = [group for group in FEATURE_GROUPS
+                       if fingerprints[group.name] != stored.fingerprints.get(group.name)
+                       or any(feature not in stored.values for feature in group.features)]
+            values = dict(stored.values)
+            values.update(row_features(fields, changed))
+            recomputed = [group.name for group in changed]
+
+            cluster = stored.cluster
+            cluster_version = stored.cluster_version
+            if featurizer.cluster_positions and (fingerprints[CLUSTERS_GROUP] != stored.fingerprints.get(CLUSTERS_GROUP)
+                                                 or cluster_version != str(models.version) or cluster is None):
+                cluster = featurizer.cluster_row(fields)
+                cluster_version = str(models.version)
+                recomputed.append(CLUSTERS_GROUP)
+
+            if recomputed or fields != stored.fields:
+                self._write(db, opportunity_id, StoredFeatures(fields, fingerprints, values, cluster, cluster_version))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return featurizer.assemble_row(values, cluster), recomputed
+
+
+feature_store = FeatureStore()
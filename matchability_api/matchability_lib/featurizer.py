@@ -0,0 +1,539 @@
+'''
+
+Matchability - Opportunity Featurizer
+Turns a batch of raw opportunities into the model features. Shared by training (matcha.py) and serving
+(matchability.py), so both compute every feature the same way.
+
+'''
+
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from matchability_lib.clustering import ClusterAssigner
+from matchability_lib.dates import days_between, parse_date, parse_date_column, year_completion_ratio
+from matchability_lib.info import info_frame, info_row
+from matchability_lib.metrics import metrics
+from matchability_lib.reference import country_info, DEFAULT_HDI
+
+# Every feature the featurizer can compute, besides the skills clusters one-hot columns
+BASE_FEATURES = [
+
+    'openings',
+    'duration_min',
+    'application_open_window',
+    'experience_max_duration',
+    'created_vs_earliest_start',
+    'created_vs_latest_end',
+    'experience_timeframe_rigidness',
+
+    'title_len',
+    'description_len',
+    'num_languages',
+    'salary',
+
+    'project_fee_cents',
+    'num_skills',
+    'num_backgrounds',
+    'has_cover_pic',
+    'has_profile_pic',
+    'computer',
+    'expected_work_schedule',
+
+    'accommodation_covered',
+    'food_weekends',
+    'health_insurance_needed',
+    'is_transportation_covered',
+    'num_meals',
+
+    'is_americas',
+    'is_asia_pacific',
+    'is_europe',
+    'is_middle_east_africa',
+    'hdi',
+    'year_completion_ratio',
+    'is_global_volunteer',
+    'is_global_talent',
+    'is_global_entrepreneur'
+
+]
+
+# Columns of the training extraction (SQL) named differently in the API payload
+COLUMN_ALIASES = {
+    'applications_close_date': 'application_close_date',
+    'cover_photo_file_size': 'cover_picture_link',
+    'profile_photo_file_size': 'profile_picture_link',
+}
+
+# Skills columns merged together for the k-means clustering
+SKILL_FIELDS = ['opp_skill_req', 'opp_skill_pref', 'opp_background_req', 'opp_background_pref']
+
+# Formatting of the skills corpus: each skill becomes a single token
+SKILL_REPLACEMENTS = [('&', 'and'), ('(', ''), (')', ''), ('-', 'dash'), ('/', ' '), (' ', '_'), (',', ' ')]
+
+REGIONS = [('is_americas', 'Americas'), ('is_asia_pacific', 'Asia Pacific'), ('is_europe', 'Europe'),
+           ('is_middle_east_africa', 'Middle East and Africa')]
+
+# The API sends the programme id, the training extraction the programme name
+PROGRAMMES = [('is_global_volunteer', ['1', 'Global Volunteer']), ('is_global_talent', ['2', 'Global Talent']),
+              ('is_global_entrepreneur', ['5', 'Global Entrepreneur'])]
+
+# As in the training: the insurance is needed when its info mentions it as mandatory or compulsory, unless the whole
+# info is one of the negations
+INSURANCE_NEGATIONS = ['Not compulsory', 'not compulsory', 'Not mandatory', 'not mandatory']
+INSURANCE_KEYWORDS = 'mandatory|compulsory'
+
+TRANSPORTATION_COVERED = ['One way', 'Return trip']
+
+# A group of features computed together from the same raw fields, over a whole frame (compute)
+# or over a single opportunity payload (compute_row)
+FeatureGroup = namedtuple('FeatureGroup', ['name', 'fields', 'features', 'compute', 'compute_row'])
+
+
+# ----------------------- COLUMN HELPERS --------------------------------###
+
+# Builds the raw opportunities frame from a DataFrame or a list of API payloads
+def to_frame(raw):
+    if isinstance(raw, pd.DataFrame):
+        frame = raw
+    else:
+        frame = pd.DataFrame(list(raw))
+    aliases = dict((alias, name) for alias, name in COLUMN_ALIASES.items() if alias in frame and name not in frame)
+    if aliases:
+        frame = frame.rename(columns=aliases)
+    return frame
+
+
+def column(frame, field):
+    if field in frame:
+        return frame[field]
+    return pd.Series([None] * len(frame), index=frame.index, dtype=object)
+
+
+# Missing values become empty strings
+def text(frame, field):
+    return column(frame, field).fillna('').astype(str)
+
+
+def number(frame, field, default):
+    return pd.to_numeric(column(frame, field), errors='coerce').fillna(default).astype(float)
+
+
+# 1 if the value is set (non empty string or non zero number), 0 otherwise
+def has_value(values):
+    numeric = pd.to_numeric(values, errors='coerce')
+    txt = values.fillna('').astype(str).str.strip()
+    is_set = np.where(numeric.notnull(), numeric.fillna(0) != 0, (txt != '') & (txt.str.lower() != 'nan'))
+    return is_set.astype(float)
+
+
+# Number of comma separated items of a text column
+def count_items(values):
+    values = values.str.strip()
+    return np.where(values != '', values.str.count(',') + 1, 0).astype(float)
+
+
+# Each date column is parsed once, all the date features are derived from the parsed values
+def parse_dates(frame, field):
+    return parse_date_column(column(frame, field))
+
+
+# ----------------------- ROW HELPERS --------------------------------###
+# Same rules as the column helpers above, applied to the values of a single payload without building a frame
+
+FIELD_ALIASES = dict((name, alias) for alias, name in COLUMN_ALIASES.items())
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def row_value(d, field):
+    if field in d:
+        return d[field]
+    if field in FIELD_ALIASES:
+        return d.get(FIELD_ALIASES[field])
+    return None
+
+
+def row_text(d, field):
+    value = row_value(d, field)
+    return '' if is_missing(value) else str(value)
+
+
+# Numeric value of a raw value, `default` when missing or not a number
+def to_number(value, default):
+    if isinstance(value, (bool, int, float, np.number)):
+        number = float(value)
+    elif isinstance(value, str) and '_' not in value:
+        try:
+            number = float(value)
+        except ValueError:
+            number = float('nan')
+    else:
+        number = float('nan')
+    return default if number != number else number
+
+
+def row_has_value(value):
+    number = to_number(value, None)
+    if number is not None:
+        return float(number != 0)
+    txt = '' if is_missing(value) else str(value).strip()
+    return float(txt != '' and txt.lower() != 'nan')
+
+
+def row_count_items(value):
+    value = value.strip()
+    return float(value.count(',') + 1) if value else 0.0
+
+
+# ----------------------- FEATURE GROUPS --------------------------------###
+
+def openings_features(frame):
+    return {
+        'openings': number(frame, 'openings', 1).values,
+        'duration_min': number(frame, 'duration_min', 0).values,
+    }
+
+
+def date_features(frame):
+    created_at = parse_dates(frame, 'created_at')
+    close_date = parse_dates(frame, 'application_close_date')
+    earliest_start = parse_dates(frame, 'earliest_start_date')
+    latest_end = parse_dates(frame, 'latest_end_date')
+    duration_min = number(frame, 'duration_min', 0).values
+
+    experience_max_duration = days_between(latest_end, earliest_start)
+    # How rigid is the timeframe of the internship? (units: number of days)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rigidness = np.where(duration_min != 0, np.round(experience_max_duration / duration_min, 1), 0)
+
+    return {
+        'application_open_window': days_between(close_date, created_at),
+        'experience_max_duration': experience_max_duration,
+        'created_vs_earliest_start': days_between(earliest_start, created_at),
+        'created_vs_latest_end': days_between(latest_end, created_at),
+        'experience_timeframe_rigidness': rigidness,
+        'year_completion_ratio': year_completion_ratio(earliest_start),
+    }
+
+
+def text_features(frame):
+    return {
+        'title_len': text(frame, 'title').str.len().values.astype(float),
+        'description_len': text(frame, 'description').str.len().values.astype(float),
+        'num_languages': count_items(text(frame, 'opp_language_req')),
+    }
+
+
+def skills_features(frame):
+    return {
+        'num_skills': count_items(text(frame, 'opp_skill_req')),
+        'num_backgrounds': count_items(text(frame, 'opp_background_req')),
+    }
+
+
+def media_features(frame):
+    return {
+        'has_cover_pic': has_value(column(frame, 'cover_picture_link')),
+        'has_profile_pic': has_value(column(frame, 'profile_picture_link')),
+        'project_fee_cents': has_value(column(frame, 'project_fee_cents')),
+    }
+
+
+def specifics_features(frame):
+    specifics = info_frame(column(frame, 'specifics_info'), 'specifics_info')
+
+    # salary given by the API, otherwise the one specified in the specifics info
+    explicit_salary = pd.to_numeric(column(frame, 'salary'), errors='coerce')
+
+    return {
+        'salary': explicit_salary.where(explicit_salary.notnull(), specifics['salary']).astype(float).values,
+        'computer': specifics['computer'].values,
+        'expected_work_schedule': specifics['expected_work_schedule'].values,
+    }
+
+
+def logistics_features(frame):
+    logistics = info_frame(column(frame, 'logistics_info'), 'logistics_info')
+    legal = info_frame(column(frame, 'legal_info'), 'legal_info')
+
+    insurance = legal['health_insurance_info']
+    insurance_needed = ~insurance.isin(INSURANCE_NEGATIONS) & insurance.str.contains(INSURANCE_KEYWORDS)
+
+    return {
+        'accommodation_covered': logistics['accommodation_covered'].values,
+        'food_weekends': logistics['food_weekends'].values,
+        'health_insurance_needed': insurance_needed.values.astype(float),
+        'is_transportation_covered': logistics['transportation_covered'].isin(TRANSPORTATION_COVERED).values
+            .astype(float),
+        'num_meals': logistics['food_covered'].values,
+    }
+
+
+def location_features(frame):
+    region = text(frame, 'name_region')
+    features = dict((feature, (region == name).values.astype(float)) for feature, name in REGIONS)
+    hdi = column(frame, 'name_entity').map(lambda name: country_info(name).hdi)
+    features['hdi'] = hdi.fillna(DEFAULT_HDI).values.astype(float)
+    return features
+
+
+def programme_features(frame):
+    # 1.0 (numbers read from a CSV) --> '1'
+    programme = text(frame, 'programme_id').str.replace(r'\.0$', '', regex=True)
+    return dict((feature, programme.isin(values).values.astype(float)) for feature, values in PROGRAMMES)
+
+
+# ----------------------- SINGLE OPPORTUNITY --------------------------------###
+# Row versions of the feature groups, used to score a single payload without the pandas overhead
+
+def openings_row(d):
+    return {
+        'openings': to_number(row_value(d, 'openings'), 1),
+        'duration_min': to_number(row_value(d, 'duration_min'), 0),
+    }
+
+
+def date_row(d):
+    created_at = parse_date(row_value(d, 'created_at'))
+    close_date = parse_date(row_value(d, 'application_close_date'))
+    earliest_start = parse_date(row_value(d, 'earliest_start_date'))
+    latest_end = parse_date(row_value(d, 'latest_end_date'))
+    duration_min = to_number(row_value(d, 'duration_min'), 0)
+
+    experience_max_duration = float(days_between(latest_end, earliest_start))
+    rigidness = float(np.round(experience_max_duration / duration_min, 1)) if duration_min != 0 else 0.0
+
+    return {
+        'application_open_window': float(days_between(close_date, created_at)),
+        'experience_max_duration': experience_max_duration,
+        'created_vs_earliest_start': float(days_between(earliest_start, created_at)),
+        'created_vs_latest_end': float(days_between(latest_end, created_at)),
+        'experience_timeframe_rigidness': rigidness,
+        'year_completion_ratio': float(year_completion_ratio(earliest_start)),
+    }
+
+
+def text_row(d):
+    return {
+        'title_len': float(len(row_text(d, 'title'))),
+        'description_len': float(len(row_text(d, 'description'))),
+        'num_languages': row_count_items(row_text(d, 'opp_language_req')),
+    }
+
+
+def skills_row(d):
+    return {
+        'num_skills': row_count_items(row_text(d, 'opp_skill_req')),
+        'num_backgrounds': row_count_items(row_text(d, 'opp_background_req')),
+    }
+
+
+def media_row(d):
+    return {
+        'has_cover_pic': row_has_value(row_value(d, 'cover_picture_link')),
+        'has_profile_pic': row_has_value(row_value(d, 'profile_picture_link')),
+        'project_fee_cents': row_has_value(row_value(d, 'project_fee_cents')),
+    }
+
+
+def specifics_row(d):
+    specifics = info_row(row_value(d, 'specifics_info'), 'specifics_info')
+
+    return {
+        'salary': to_number(row_value(d, 'salary'), specifics['salary']),
+        'computer': specifics['computer'],
+        'expected_work_schedule': specifics['expected_work_schedule'],
+    }
+
+
+def logistics_row(d):
+    logistics = info_row(row_value(d, 'logistics_info'), 'logistics_info')
+    legal = info_row(row_value(d, 'legal_info'), 'legal_info')
+
+    insurance = legal['health_insurance_info']
+    insurance_needed = insurance not in INSURANCE_NEGATIONS and re.search(INSURANCE_KEYWORDS, insurance) is not None
+
+    return {
+        'accommodation_covered': logistics['accommodation_covered'],
+        'food_weekends': logistics['food_weekends'],
+        'health_insurance_needed': float(insurance_needed),
+        'is_transportation_covered': float(logistics['transportation_covered'] in TRANSPORTATION_COVERED),
+        'num_meals': logistics['food_covered'],
+    }
+
+
+def location_row(d):
+    region = row_text(d, 'name_region')
+    features = dict((feature, float(region == name)) for feature, name in REGIONS)
+    hdi = country_info(row_value(d, 'name_entity')).hdi
+    features['hdi'] = DEFAULT_HDI if is_missing(hdi) else float(hdi)
+    return features
+
+
+def programme_row(d):
+    programme = re.sub(r'\.0$', '', row_text(d, 'programme_id'))
+    return dict((feature, float(programme in values)) for feature, values in PROGRAMMES)
+
+
+FEATURE_GROUPS = [
+    FeatureGroup('openings', ['openings', 'duration_min'], ['openings', 'duration_min'], openings_features,
+                 openings_row),
+    FeatureGroup('dates', ['created_at', 'application_close_date', 'earliest_start_date', 'latest_end_date',
+                           'duration_min'],
+                 ['application_open_window', 'experience_max_duration', 'created_vs_earliest_start',
+                  'created_vs_latest_end', 'experience_timeframe_rigidness', 'year_completion_ratio'],
+                 date_features, date_row),
+    FeatureGroup('text', ['title', 'description', 'opp_language_req'],
+                 ['title_len', 'description_len', 'num_languages'], text_features, text_row),
+    FeatureGroup('skills', ['opp_skill_req', 'opp_background_req'], ['num_skills', 'num_backgrounds'],
+                 skills_features, skills_row),
+    FeatureGroup('media', ['cover_picture_link', 'profile_picture_link', 'project_fee_cents'],
+                 ['has_cover_pic', 'has_profile_pic', 'project_fee_cents'], media_features, media_row),
+    FeatureGroup('specifics', ['salary', 'specifics_info'], ['salary', 'computer', 'expected_work_schedule'],
+                 specifics_features, specifics_row),
+    FeatureGroup('logistics', ['logistics_info', 'legal_info'],
+                 ['accommodation_covered', 'food_weekends', 'health_insurance_needed', 'is_transportation_covered',
+                  'num_meals'], logistics_features, logistics_row),
+    FeatureGroup('location', ['name_region', 'name_entity'],
+                 ['is_americas', 'is_asia_pacific', 'is_europe', 'is_middle_east_africa', 'hdi'],
+                 location_features, location_row),
+    FeatureGroup('programme', ['programme_id'],
+                 ['is_global_volunteer', 'is_global_talent', 'is_global_entrepreneur'], programme_features,
+                 programme_row),
+]
+
+
+# Base feature values of a single opportunity payload, computed by the given feature groups
+def row_features(d, groups=FEATURE_GROUPS):
+    values = {}
+    timings = []
+    for group in groups:
+        start = time.perf_counter()
+        values.update(group.compute_row(d))
+        timings.append((group.name, time.perf_counter() - start))
+    metrics.observe_stages(timings)
+    return values
+
+
+# Merged and formatted skills text of each opportunity, the corpus of the TF-IDF + k-means clustering
+def skills_text(frame):
+    skills = text(frame, SKILL_FIELDS[0]).str.strip()
+    for field in SKILL_FIELDS[1:]:
+        skills = skills + ',' + text(frame, field).str.strip()
+    # drop the separators of the missing columns
+    skills = skills.str.replace(r',{2,}', ',', regex=True).str.strip(',')
+    for k, v in SKILL_REPLACEMENTS:
+        skills = skills.str.replace(k, v, regex=False)
+    return skills
+
+
+def row_skills_text(d):
+    skills = ','.join(row_text(d, field).strip() for field in SKILL_FIELDS)
+    skills = re.sub(r',{2,}', ',', skills).strip(',')
+    for k, v in SKILL_REPLACEMENTS:
+        skills = skills.replace(k, v)
+    return skills
+
+
+# Returns the index of the cluster one-hot encoded by a feature name (cl1_... --> 0), None if not a cluster column
+def cluster_slot(feature):
+    match = re.match(r'^cl(\d+)_', str(feature))
+    if match:
+        return int(match.group(1)) - 1
+    return None
+
+
+# Computes the model features of a batch of opportunities with column-wise operations.
+# Without a fitted vectorizer and k-means (training, before the clustering), only the base features are computed.
+class OpportunityFeaturizer(object):
+
+    def __init__(self, vectorizer=None, kmeans=None, cluster_terms=None, features=None):
+        self.vectorizer = vectorizer
+        self.kmeans = kmeans
+        self.assigner = ClusterAssigner(vectorizer, kmeans) if kmeans is not None else None
+        self.cluster_terms = list(cluster_terms) if cluster_terms is not None else []
+        self.cluster_columns = list(self.cluster_terms)
+        self.features = list(features) if features is not None else BASE_FEATURES + self.cluster_columns
+
+        # position of each feature in the model input
+        self.base_positions = []
+        self.cluster_positions = []
+        for position, feature in enumerate(self.features):
+            if feature in BASE_FEATURES:
+                self.base_positions.append((position, feature))
+            elif cluster_slot(feature) is not None:
+                self.cluster_positions.append((position, cluster_slot(feature)))
+                if cluster_slot(feature) < len(self.cluster_columns):
+                    self.cluster_columns[cluster_slot(feature)] = feature
+            else:
+                raise ValueError("Unknown feature: " + str(feature))
+
+    # Base features of the opportunities, one column per feature
+    def base_frame(self, raw):
+        frame = to_frame(raw)
+        columns = {}
+        timings = []
+        for group in FEATURE_GROUPS:
+            start = time.perf_counter()
+            columns.update(group.compute(frame))
+            timings.append((group.name, time.perf_counter() - start))
+        metrics.observe_stages(timings)
+        return pd.DataFrame(columns, index=frame.index, columns=BASE_FEATURES)
+
+    # Skills cluster of each opportunity
+    def clusters(self, raw):
+        with metrics.timer('clusters'):
+            skills = skills_text(to_frame(raw))
+            return self.assigner.assign(skills)
+
+    # One-hot encoded skills cluster of the opportunities, one column per cluster
+    def cluster_frame(self, raw):
+        labels = self.clusters(raw)
+        columns = dict((name, (labels == slot).astype(int)) for slot, name in enumerate(self.cluster_columns))
+        return pd.DataFrame(columns, index=to_frame(raw).index, columns=self.cluster_columns)
+
+    # Base features and one-hot encoded skills clusters of the opportunities
+    def frame(self, raw):
+        frame = to_frame(raw)
+        features = self.base_frame(frame)
+        if self.kmeans is not None:
+            features = pd.concat([features, self.cluster_frame(frame)], axis=1)
+        return features
+
+    # Model input matrix of the opportunities, columns in the order of the model features
+    def transform(self, raw):
+        frame = to_frame(raw)
+        base = self.base_frame(frame)
+        x_data = np.zeros((len(frame), len(self.features)))
+        for position, feature in self.base_positions:
+            x_data[:, position] = base[feature].values
+        if self.cluster_positions:
+            labels = self.clusters(frame)
+            for position, slot in self.cluster_positions:
+                x_data[:, position] = labels == slot
+        return x_data
+
+    # Skills cluster of a single opportunity payload
+    def cluster_row(self, d):
+        with metrics.timer('clusters'):
+            return self.assigner.assign_one(row_skills_text(d))
+
+    # Model input vector from the base feature values and the skills cluster of an opportunity
+    def assemble_row(self, values, label):
+        x_row = np.zeros(len(self.features))
+        for position, feature in self.base_positions:
+            x_row[position] = values[feature]
+        for position, slot in self.cluster_positions:
+            x_row[position] = label == slot
+        return x_row
+
+    # Model input vector of a single opportunity payload, same values as transform([d])[0] without building a frame
+    def transform_row(self, d):
+        label = self.cluster_row(d) if self.cluster_positions else None
+        return self.assemble_row(row_features(d), label)
@@ -0,0 +1,228 @@
+'''
+
+Matchability - Compiled Forest
+Evaluates the trained Random Forest from flat NumPy arrays, all the trees of a batch at once.
+
+'''
+
+import numpy as np
+
+try:
+    from sklearn.tree._tree import NODE_DTYPE, TREE_LEAF, TREE_UNDEFINED, Tree
+except ImportError:
+    Tree = None
+
+# Rows evaluated together, bounds the memory used by the (rows x trees) leaf matrices
+FOREST_BATCH_ROWS = 256
+
+
+# All the trees of a RandomForestClassifier flattened into contiguous arrays indexed by a global node id.
+# A leaf points to itself on both sides with an infinite threshold.
+# When compiled from the fitted forest, the trees' native (C) traversal is kept to find the leaves: measured faster
+# than the NumPy traversal at every batch size. A forest read from its arrays gets it back with with_native_trees(),
+# otherwise the NumPy traversal is used.
+class CompiledForest(object):
+
+    # Arrays defining the forest, see arrays() and from_arrays()
+    ARRAYS = ['classes', 'roots', 'feature', 'threshold', 'children', 'is_leaf', 'value', 'max_depth']
+
+    def __init__(self, classes, roots, feature, threshold, children, is_leaf, value, max_depth, trees=None):
+        self.classes_ = np.asarray(classes)
+        self.n_classes_ = len(self.classes_)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        # both children of each node side by side (right, left), indexed by 2 * node + (x <= threshold)
+        self.children = np.asarray(children, dtype=np.intp)
+        self.is_leaf = np.asarray(is_leaf, dtype=bool)
+        # class probabilities of each leaf, already normalized as DecisionTreeClassifier.predict_proba does
+        self.value = np.asarray(value, dtype=np.float64)
+        self.max_depth = int(max_depth)
+        self.n_estimators = len(self.roots)
+        self.trees = trees
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        if getattr(forest, 'n_outputs_', 1) != 1:
+            raise ValueError("Only single output forests can be compiled.")
+        n_classes = int(forest.n_classes_)
+
+        roots, feature, threshold, left, right, value = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            roots.append(offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+
+            proba = tree.value[:, 0, :n_classes].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value.append(proba / normalizer)
+
+            max_depth = max(max_depth, tree.max_depth)
+            offset += tree.node_count
+
+        left = np.concatenate(left)
+        children = np.empty(2 * offset, dtype=np.intp)
+        children[0::2] = np.concatenate(right)
+        children[1::2] = left
+        return cls(forest.classes_, roots, np.concatenate(feature), np.concatenate(threshold), children,
+                   left == np.arange(offset), np.concatenate(value), max_depth,
+                   trees=[estimator.tree_ for estimator in forest.estimators_])
+
+    def arrays(self):
+        return {
+            'classes': self.classes_,
+            'roots': self.roots,
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'children': self.children,
+            'is_leaf': self.is_leaf,
+            'value': self.value,
+            'max_depth': np.array(self.max_depth),
+        }
+
+    # Forest evaluated with the NumPy traversal from the given arrays (e.g. read-only memory maps), never copied
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*[arrays[name] for name in cls.ARRAYS])
+
+    # Rebuilds the native trees from the arrays (at the cost of a copy of the nodes in the memory of the process), for
+    # the native traversal. Left with the NumPy traversal without scikit-learn.
+    def with_native_trees(self, n_features):
+        if Tree is None:
+            return self
+        n_classes = np.array([self.n_classes_], dtype=np.intp)
+        ends = np.append(self.roots[1:], len(self.feature))
+        trees = []
+        for root, end in zip(self.roots, ends):
+            is_leaf = self.is_leaf[root:end]
+            nodes = np.zeros(end - root, dtype=NODE_DTYPE)
+            nodes['left_child'] = np.where(is_leaf, TREE_LEAF, self.children[2 * root + 1:2 * end:2] - root)
+            nodes['right_child'] = np.where(is_leaf, TREE_LEAF, self.children[2 * root:2 * end:2] - root)
+            nodes['feature'] = np.where(is_leaf, TREE_UNDEFINED, self.feature[root:end])
+            nodes['threshold'] = np.where(is_leaf, TREE_UNDEFINED, self.threshold[root:end])
+            tree = Tree(n_features, n_classes, 1)
+            tree.__setstate__({'max_depth': self.max_depth, 'node_count': end - root, 'nodes': nodes,
+                               'values': np.ascontiguousarray(self.value[root:end, np.newaxis, :])})
+            trees.append(tree)
+        self.trees = trees
+        return self
+
+    # Same float32 conversion and checks as the forest's own input validation
+    @staticmethod
+    def check_input(x_data, n_features=None):
+        x_data = np.ascontiguousarray(np.atleast_2d(x_data), dtype=np.float32)
+        if n_features is not None and x_data.shape[1] != n_features:
+            raise ValueError("Expected " + str(n_features) + " features, got " + str(x_data.shape[1]))
+        if not np.isfinite(x_data).all():
+            raise ValueError("Input contains NaN, infinity or a value too large for dtype('float32').")
+        return x_data
+
+    # Leaf reached in every tree by every row: (rows x trees) matrix of global node ids
+    def apply(self, x_data):
+        if self.trees is not None:
+            leaves = np.empty((x_data.shape[0], self.n_estimators), dtype=np.intp)
+            for t, tree in enumerate(self.trees):
+                leaves[:, t] = tree.apply(x_data)
+            leaves += self.roots
+            return leaves
+        return self.traverse(x_data)
+
+    # Walks all the trees for all the rows at once, one tree level per step, straight from the arrays. The (row, tree)
+    # pairs are ordered tree by tree, so each step reads the nodes of one tree after the other. A pair at a leaf stays
+    # on it (infinite threshold): the pairs at a leaf are only dropped once they are half of the pairs walked, instead
+    # of at every step.
+    def traverse(self, x_data):
+        n_rows, n_features = x_data.shape
+        x_flat = x_data.ravel()
+        nodes = np.repeat(self.roots, n_rows)
+        offsets = np.tile(np.arange(n_rows) * n_features, self.n_estimators)
+        leaves, active = nodes, None
+        size = nodes.size
+        while True:
+            threshold = self.threshold.take(nodes)
+            internal = threshold != np.inf
+            count = np.count_nonzero(internal)
+            if count <= size // 2:
+                if active is None:
+                    leaves, active = nodes, np.flatnonzero(internal)
+                else:
+                    leaves[active] = nodes
+                    active = active[internal]
+                if count == 0:
+                    break
+                nodes, offsets, threshold = nodes[internal], offsets[internal], threshold[internal]
+                size = count
+            split = self.feature.take(nodes)
+            split += offsets
+            go_left = x_flat.take(split) <= threshold
+            nodes = self.children.take(2 * nodes + go_left)
+        return leaves.reshape(self.n_estimators, n_rows).T
+
+    # Bit-for-bit equal to RandomForestClassifier.predict_proba: the trees' probabilities are summed one
+    # tree after the other from zero (a cumulative sum is sequential too, unlike np.sum), then averaged
+    def predict_proba(self, x_data):
+        x_data = self.check_input(x_data)
+        if self.trees is not None and x_data.shape[0] > FOREST_BATCH_ROWS:
+            # big batches: accumulate tree by tree, without the (rows x trees x classes) leaf values
+            proba = np.zeros((x_data.shape[0], self.n_classes_))
+            for root, tree in zip(self.roots, self.trees):
+                proba += self.value[tree.apply(x_data) + root]
+        else:
+            proba = np.empty((x_data.shape[0], self.n_classes_))
+            for start in range(0, x_data.shape[0], FOREST_BATCH_ROWS):
+                leaves = self.apply(x_data[start:start + FOREST_BATCH_ROWS])
+                proba[start:start + FOREST_BATCH_ROWS] = np.cumsum(self.value[leaves], axis=1)[:, -1]
+        proba /= self.n_estimators
+        return proba
+
+    # Path-based (Saabas) attribution of the predicted probabilities, computed in the same traversal as the prediction.
+    # Each split moves the probability from the node's value to the child's value, the difference is credited to the
+    # split feature. Returns the probabilities (same as predict_proba), the bias (average root value) and the
+    # (rows x features x classes) contributions: bias + contributions summed over the features = probabilities.
+    def explain(self, x_data):
+        x_data = self.check_input(x_data)
+        n_rows, n_features = x_data.shape
+        proba = np.empty((n_rows, self.n_classes_))
+        contributions = np.empty((n_rows, n_features, self.n_classes_))
+        for start in range(0, n_rows, FOREST_BATCH_ROWS):
+            leaves, contributions[start:start + FOREST_BATCH_ROWS] = \
+                self.traverse_contributions(x_data[start:start + FOREST_BATCH_ROWS])
+            proba[start:start + FOREST_BATCH_ROWS] = np.cumsum(self.value[leaves], axis=1)[:, -1]
+        proba /= self.n_estimators
+        contributions /= self.n_estimators
+        bias = self.value[self.roots].mean(axis=0)
+        return proba, bias, contributions
+
+    # NumPy traversal (see traverse()) also summing the value deltas of the splits per (row, split feature)
+    def traverse_contributions(self, x_data):
+        n_rows, n_features = x_data.shape
+        x_flat = x_data.ravel()
+        leaves = np.tile(self.roots, n_rows)
+        offsets = np.repeat(np.arange(n_rows) * n_features, self.n_estimators)
+        contributions = np.zeros((self.n_classes_, n_rows * n_features))
+        active = np.arange(len(leaves))
+        nodes = leaves[active]
+        while active.size:
+            split = offsets + self.feature[nodes]
+            go_left = x_flat[split] <= self.threshold[nodes]
+            children = self.children[2 * nodes + go_left]
+            delta = self.value[children] - self.value[nodes]
+            for c in range(self.n_classes_):
+                contributions[c] += np.bincount(split, weights=delta[:, c], minlength=n_rows * n_features)
+            nodes = children
+            leaves[active] = nodes
+            moving = ~self.is_leaf[nodes]
+            active, offsets, nodes = active[moving], offsets[moving], nodes[moving]
+        return leaves.reshape(n_rows, self.n_estimators), contributions.T.reshape(n_rows, n_features, self.n_classes_)
+
+    def predict(self, x_data):
+        return self.classes_.take(np.argmax(self.predict_proba(x_data), axis=1))
@@ -0,0 +1,103 @@
+'''
+
+Matchability - Info Columns
+Parsing of the info columns of the opportunities (specifics_info, logistics_info, legal_info) into typed columns of
+the keys used by the model features, in a single parsing of each info value. The training extraction holds hstore
+strings ("key"=>"value", "key"=>"value"), the API sends a list holding one JSON object. Shared by training and
+serving (featurizer.py).
+
+'''
+
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# A key of an info column and how its value is typed:
+# 'text' (string), 'flag' (1.0 if 'true'), 'present' (1.0 if the key is in the info, whatever its value), 'amount'
+# (digits once the currency marks are removed, 0.0 otherwise), 'count' (first integer of the value, 0.0 if none)
+InfoField = namedtuple('InfoField', ['column', 'key', 'kind'])
+
+INFO_FIELDS = [
+    InfoField('specifics_info', 'salary', 'amount'),
+    InfoField('specifics_info', 'computer', 'flag'),
+    InfoField('specifics_info', 'expected_work_schedule', 'present'),
+    InfoField('logistics_info', 'accommodation_covered', 'flag'),
+    InfoField('logistics_info', 'food_covered', 'count'),
+    InfoField('logistics_info', 'food_weekends', 'flag'),
+    InfoField('logistics_info', 'transportation_covered', 'text'),
+    InfoField('legal_info', 'health_insurance_info', 'text'),
+]
+
+INFO_FIELDS_BY_COLUMN = dict((column, [field for field in INFO_FIELDS if field.column == column])
+                             for column in set(field.column for field in INFO_FIELDS))
+
+AMOUNT_UNWANTED = ['$', 'USD', 'rub', ' ']
+
+COUNT_PATTERN = r'\b(\d+)\b'
+
+
+# Parses one of the info columns into a dictionary of all its keys
+def parse_info(value):
+    if isinstance(value, list):
+        value = value[0] if value else {}
+    if isinstance(value, dict):
+        return dict((str(k).strip(), '' if v is None else str(v).strip()) for k, v in value.items())
+    info = {}
+    if isinstance(value, str):
+        value = value.replace('"', '').replace('\\', '')
+        for attribute in value.split(','):
+            attribute = attribute.split('=>')
+            if len(attribute) < 2:
+                continue
+            key = attribute[0].strip()
+            if key != ':to' and key != 'to':
+                info[key] = attribute[1].strip()
+    return info
+
+
+# Typed value of a key of an info column, None when the key is not in the info
+def typed_value(value, kind):
+    if kind == 'present':
+        return float(value is not None)
+    if value is None:
+        value = ''
+    if kind == 'text':
+        return value
+    if kind == 'flag':
+        return float(value == 'true')
+    if kind == 'amount':
+        for unwanted in AMOUNT_UNWANTED:
+            value = value.replace(unwanted, '')
+        return float(int(value)) if value.isdigit() else 0.0
+    if kind == 'count':
+        match = re.search(COUNT_PATTERN, value)
+        return float(match.group(1)) if match else 0.0
+    raise ValueError("Unknown info kind: " + str(kind))
+
+
+# Typed values of the keys used by the model of the info column of a single opportunity
+def info_row(value, column):
+    info = parse_info(value)
+    return dict((field.key, typed_value(info.get(field.key), field.kind))
+                for field in INFO_FIELDS_BY_COLUMN[column])
+
+
+# Typed values of the keys used by the model of an info column (a Series of hstore strings, API objects or missing
+# values), one column per key. The info strings of the extraction repeat a lot (templates): each distinct string is
+# parsed once and its values are spread to the opportunities holding it.
+def info_frame(values, column):
+    fields = INFO_FIELDS_BY_COLUMN[column]
+    try:
+        codes, uniques = pd.factorize(values)
+    except TypeError:
+        # API objects (lists, dicts) are not hashable, each one is parsed
+        codes, uniques = np.arange(len(values)), values.values
+    # the missing values (code -1) get the values of the last row
+    rows = [info_row(value, column) for value in uniques] + [info_row(None, column)]
+    columns = {}
+    for field in fields:
+        typed = np.array([row[field.key] for row in rows], dtype=object if field.kind == 'text' else float)
+        columns[field.key] = typed[codes]
+    return pd.DataFrame(columns, index=values.index, columns=[field.key for field in fields])
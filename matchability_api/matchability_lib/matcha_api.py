@@ -5,19 +5,25 @@ Receiving POST request and returning predictions.
 
 '''
 
-from flask import Flask, request
+import json
+
+from flask import Flask, Response, request, stream_with_context
 # import our integration
-from matchability import matchability
+from matchability import cache_stats, matchability, matchability_batch, matchability_stored, matchability_stream, \
+    metrics_text
+from matchability_lib.metrics import metrics, track_request, track_stream
 
 app = Flask(__name__)  # create the Flask app
 
 
 @app.route('/api/opportunity', methods=['GET', 'POST'])
+@track_request('opportunity')
 def matcha_request():
     if request.method == "POST":
-        req_data = request.get_json()
+        with metrics.timer('parse'):
+            req_data = request.get_json()
         data = req_data['data']
-        res_as_json = matchability(data)
+        res_as_json = matchability(data, explain=bool(req_data.get('explain')))
 
         return res_as_json
 
@@ -25,5 +31,53 @@ def matcha_request():
         return "Error: Method not allowed. Please use POST request."
 
 
+@app.route('/api/opportunity/batch', methods=['POST'])
+@track_request('opportunity_batch')
+def matcha_batch_request():
+    with metrics.timer('parse'):
+        req_data = request.get_json()
+    data = req_data['data']
+    res_as_json = matchability_batch(data, explain=bool(req_data.get('explain')))
+
+    return res_as_json
+
+
+@app.route('/api/opportunity/<int:opportunity_id>', methods=['POST'])
+@track_request('opportunity_update')
+def matcha_update_request(opportunity_id):
+    with metrics.timer('parse'):
+        req_data = request.get_json()
+    data = req_data['data']
+    res_as_json = matchability_stored(opportunity_id, data)
+
+    return res_as_json
+
+
+@app.route('/api/opportunity/<int:opportunity_id>/rescore', methods=['POST'])
+@track_request('opportunity_rescore')
+def matcha_rescore_request(opportunity_id):
+    res_as_json = matchability_stored(opportunity_id)
+    if res_as_json is None:
+        return json.dumps({'status': 'ERROR', 'error': 'Unknown opportunity: ' + str(opportunity_id)}), 404
+
+    return res_as_json
+
+
+@app.route('/api/opportunity/stream', methods=['POST'])
+def matcha_stream_request():
+    return Response(stream_with_context(track_stream('opportunity_stream', matchability_stream(request.stream))),
+                    mimetype='application/x-ndjson')
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats_request():
+    return json.dumps(cache_stats())
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_request():
+    return Response(metrics_text(), mimetype='text/plain')
+
+
 # Run the app on port 5000
 app.run(port=5000)
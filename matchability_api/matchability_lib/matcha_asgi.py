@@ -0,0 +1,213 @@
+'''
+
+Matchability - Async API
+Receiving POST requests and returning predictions, concurrent requests are scored together in micro-batches.
+Served by any ASGI server, e.g. from the matchability_api directory:
+
+    uvicorn matchability_lib.matcha_asgi:app --port 5000
+
+'''
+
+import asyncio
+import json
+import re
+import time
+from datetime import datetime
+
+from matchability_lib.batcher import MicroBatcher
+from matchability_lib.matchability import cache_stats, matchability_batch, matchability_stored, matchability_stream, \
+    metrics_text, score_opportunities
+from matchability_lib.metrics import metrics, track_stream
+from matchability_lib.registry import registry
+
+# Scoring endpoints, with their name in the request metrics
+ENDPOINTS = {'/api/opportunity': 'opportunity', '/api/opportunity/batch': 'opportunity_batch',
+             '/api/opportunity/stream': 'opportunity_stream'}
+
+# Endpoints of the opportunities of the feature store: /api/opportunity/<id> and /api/opportunity/<id>/rescore
+STORED_ENDPOINT = re.compile(r'^/api/opportunity/(\d+)(/rescore)?$')
+
+
+# Name of the endpoint of a path (None if there is none) and the opportunity id of the feature store endpoints
+def endpoint_of(path):
+    if path in ENDPOINTS:
+        return ENDPOINTS[path], None
+    match = STORED_ENDPOINT.match(path)
+    if match:
+        return 'opportunity_rescore' if match.group(2) else 'opportunity_update', int(match.group(1))
+    return None, None
+
+
+def score_batch(items):
+    return score_opportunities(items, registry.get())
+
+
+batcher = MicroBatcher(score_batch)
+
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_response(send, status, content, content_type=b'application/json'):
+    content = content.encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type),
+                            (b'content-length', str(len(content)).encode('ascii'))]})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+def error_response(status, error):
+    return status, json.dumps({'status': 'ERROR', 'error': error})
+
+
+# Request body read as a binary stream by the scoring code running in a worker thread: each message is received from
+# the event loop `loop`, blocking the worker thread only
+class BodyStream(object):
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.buffer = b''
+        self.more_body = True
+
+    def readline(self, size=-1):
+        while self.more_body and b'\n' not in self.buffer and (size < 0 or len(self.buffer) < size):
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            self.buffer += message.get('body', b'')
+            self.more_body = message.get('more_body', False)
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        if size >= 0:
+            end = min(end, size)
+        line, self.buffer = self.buffer[:end], self.buffer[end:]
+        return line
+
+
+# Single opportunity: scored with the concurrent requests' opportunities, same response as the sync API.
+# Explained predictions are scored on their own.
+async def matcha_request(data, explain=False):
+    if explain:
+        result = (await asyncio.get_event_loop().run_in_executor(
+            None, score_opportunities, [data], registry.get(), True))[0]
+    else:
+        result = await batcher.submit(data)
+    if result['status'] != 'OK':
+        return error_response(400, result['error'])
+    result['timestamp'] = str(datetime.now())
+    return 200, json.dumps(result)
+
+
+async def matcha_batch_request(data, explain=False):
+    if not isinstance(data, list):
+        return error_response(400, "'data' must be a list of opportunities.")
+    return 200, await asyncio.get_event_loop().run_in_executor(None, matchability_batch, data, explain)
+
+
+async def matcha_update_request(opportunity_id, data):
+    if not isinstance(data, dict):
+        return error_response(400, "'data' must be an opportunity.")
+    return 200, await asyncio.get_event_loop().run_in_executor(None, matchability_stored, opportunity_id, data)
+
+
+async def matcha_rescore_request(opportunity_id):
+    result = await asyncio.get_event_loop().run_in_executor(None, matchability_stored, opportunity_id)
+    if result is None:
+        return error_response(404, "Unknown opportunity: " + str(opportunity_id))
+    return 200, result
+
+
+# Newline-delimited JSON opportunities in, newline-delimited JSON results out, as in the sync APIs: the body is read
+# and scored chunk by chunk in a worker thread, each result is sent as soon as it is scored. Timed and counted to the
+# end of the stream (track_stream).
+async def matcha_stream_request(receive, send):
+    loop = asyncio.get_event_loop()
+    results = track_stream('opportunity_stream', matchability_stream(BodyStream(receive, loop)))
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')]})
+    try:
+        while True:
+            result = await loop.run_in_executor(None, next, results, None)
+            if result is None:
+                break
+            await send({'type': 'http.response.body', 'body': result.encode('utf-8'), 'more_body': True})
+    except Exception as e:
+        # the status is already sent, the response ends early
+        print("Streaming request failed. Error is:", e)
+    finally:
+        results.close()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def handle_request(scope, receive):
+    path = scope['path'].rstrip('/')
+    method = scope['method']
+    endpoint, opportunity_id = endpoint_of(path)
+
+    if method == 'GET':
+        if path == '/api/batching/stats':
+            return 200, json.dumps(batcher.stats())
+        if path == '/api/cache/stats':
+            return 200, json.dumps(cache_stats())
+        if endpoint is not None:
+            return error_response(405, "Method not allowed. Please use POST request.")
+        return error_response(404, "Not found.")
+
+    if method != 'POST' or endpoint is None:
+        return error_response(404, "Not found.")
+    if endpoint == 'opportunity_rescore':
+        return await matcha_rescore_request(opportunity_id)
+    body = await read_body(receive)
+    try:
+        with metrics.timer('parse'):
+            request = json.loads(body.decode('utf-8'))
+            data = request['data']
+            explain = bool(request.get('explain'))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return error_response(400, "Request body must be a JSON object with a 'data' field.")
+    if endpoint == 'opportunity':
+        return await matcha_request(data, explain)
+    if endpoint == 'opportunity_update':
+        return await matcha_update_request(opportunity_id, data)
+    return await matcha_batch_request(data, explain)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            registry.get()  # load the model before accepting requests
+            batcher.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await batcher.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# ASGI application
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    path = scope['path'].rstrip('/')
+    if scope['method'] == 'GET' and path == '/api/metrics':
+        return await send_response(send, 200, metrics_text(), b'text/plain; version=0.0.4; charset=utf-8')
+    endpoint, opportunity_id = endpoint_of(path)
+    if scope['method'] == 'POST' and endpoint == 'opportunity_stream':
+        return await matcha_stream_request(receive, send)
+    start = time.perf_counter()
+    try:
+        status, content = await handle_request(scope, receive)
+    except Exception as e:
+        print("Scoring request failed. Error is:", e)
+        status, content = error_response(500, str(e))
+    if endpoint is not None and scope['method'] == 'POST':
+        metrics.observe_request(endpoint, time.perf_counter() - start, status >= 400)
+    await send_response(send, status, content)
@@ -0,0 +1,207 @@
+'''
+
+Matchability - Metrics
+Always-on latency histograms of the scoring stages and request counters of the process, rendered in the
+Prometheus text format by the metrics endpoint.
+
+'''
+
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Upper bounds (seconds) of the latency buckets, from 20 microseconds to 10 seconds
+LATENCY_BUCKETS = [0.00002, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Upper bounds of the batch size buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384]
+
+# Quantiles estimated from the histograms
+QUANTILES = [0.5, 0.95, 0.99]
+
+METRICS_PREFIX = 'matchability_'
+
+
+# Cumulated counts of the observations per bucket. Not thread-safe, the Metrics lock protects it.
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Quantile estimated by linear interpolation inside its bucket, like Prometheus' histogram_quantile()
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+# Times a block of code into the histogram of a stage: `with metrics.timer('forest'): ...`
+class StageTimer(object):
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.requests = {}
+        self.counters = {}
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+
+    def timer(self, stage):
+        return StageTimer(self, stage)
+
+    def observe(self, stage, seconds):
+        self.observe_stages([(stage, seconds)])
+
+    # Records several (stage, seconds) timings at once, with a single lock acquisition
+    def observe_stages(self, timings):
+        with self._lock:
+            for stage, seconds in timings:
+                histogram = self.stages.get(stage)
+                if histogram is None:
+                    histogram = self.stages[stage] = Histogram(LATENCY_BUCKETS)
+                histogram.observe(seconds)
+
+    def observe_request(self, endpoint, seconds, error):
+        with self._lock:
+            histogram = self.requests.get(endpoint)
+            if histogram is None:
+                histogram = self.requests[endpoint] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            self.counters[('errors', endpoint)] = self.counters.get(('errors', endpoint), 0) + int(error)
+
+    def observe_batch(self, size):
+        with self._lock:
+            self.batch_sizes.observe(size)
+
+    # Prometheus text format of the metrics
+    def render(self):
+        with self._lock:
+            lines = []
+            lines += histogram_lines('stage_seconds', 'Latency of the scoring stages', 'stage', self.stages)
+            lines += histogram_lines('request_seconds', 'Latency of the API requests', 'endpoint', self.requests)
+            lines += counter_lines('requests_total', 'API requests', 'endpoint',
+                                   dict((endpoint, h.count) for endpoint, h in self.requests.items()))
+            lines += counter_lines('errors_total', 'Failed API requests', 'endpoint',
+                                   dict((endpoint, count) for (name, endpoint), count in self.counters.items()
+                                        if name == 'errors'))
+            lines += histogram_lines('batch_size', 'Opportunities scored together', None,
+                                     {None: self.batch_sizes})
+            return lines
+
+
+def label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+                          for name, value in labels) + '}'
+
+
+def sample_line(name, labels, value):
+    return METRICS_PREFIX + name + label_text(labels) + ' ' + repr(float(value))
+
+
+def header_lines(name, help_text, metric_type):
+    return ['# HELP ' + METRICS_PREFIX + name + ' ' + help_text, '# TYPE ' + METRICS_PREFIX + name + ' ' + metric_type]
+
+
+# Buckets, sum and count of each histogram, followed by a gauge of its estimated quantiles
+def histogram_lines(name, help_text, label, histograms):
+    lines = header_lines(name, help_text, 'histogram')
+    quantile_lines = header_lines(name + '_quantile', help_text + ' (estimated quantiles)', 'gauge')
+    for value in sorted(histograms, key=str):
+        histogram = histograms[value]
+        labels = [(label, value)] if label else []
+        cumulated = 0
+        for bound, count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+            cumulated += count
+            lines.append(sample_line(name + '_bucket', labels + [('le', bound)], cumulated))
+        lines.append(sample_line(name + '_sum', labels, histogram.sum))
+        lines.append(sample_line(name + '_count', labels, histogram.count))
+        for q in QUANTILES:
+            quantile_lines.append(sample_line(name + '_quantile', labels + [('quantile', q)], histogram.quantile(q)))
+    return lines + quantile_lines
+
+
+def counter_lines(name, help_text, label, values):
+    lines = header_lines(name, help_text, 'counter')
+    for value in sorted(values, key=str):
+        lines.append(sample_line(name, [(label, value)] if label else [], values[value]))
+    return lines
+
+
+def gauge_lines(name, help_text, label, values):
+    lines = header_lines(name, help_text, 'gauge')
+    for value in sorted(values, key=str):
+        lines.append(sample_line(name, [(label, value)] if label else [], values[value]))
+    return lines
+
+
+metrics = Metrics()
+
+
+# Counts and times the requests of an API endpoint. A request fails if it raises or returns an error status.
+def track_request(endpoint):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = True
+            try:
+                response = view(*args, **kwargs)
+                # Django/DRF responses, or Flask (body, status) tuples
+                status = response[1] if isinstance(response, tuple) else getattr(response, 'status_code', 200)
+                error = status >= 400
+                return response
+            finally:
+                metrics.observe_request(endpoint, time.perf_counter() - start, error)
+        return wrapper
+    return decorator
+
+
+# Counts and times the requests of a streaming endpoint, whose results are generated while the response is sent:
+# from the call to the end of the stream. A request fails if the stream raises or is not read to its end.
+def track_stream(endpoint, results):
+    start = time.perf_counter()
+
+    def tracked():
+        error = True
+        try:
+            for result in results:
+                yield result
+            error = False
+        finally:
+            metrics.observe_request(endpoint, time.perf_counter() - start, error)
+    return tracked()
@@ -0,0 +1,197 @@
+'''
+
+Matchability - Reference Data
+Country lookup and Human Development Index (HDI) tables shared by training and serving.
+
+'''
+
+import csv
+import os
+from collections import namedtuple
+
+from matchability_api.settings import BASE_DIR
+
+HDI_CSV = os.path.join(BASE_DIR, 'matchability_lib', 'Data', 'hdi_gdp_2015.csv')
+HDI_COLUMN = 'Historical Index of Human Development (including GDP metric) ((0-1; higher values are better))'
+
+# HDI used for unknown countries and for countries missing from the HDI table
+DEFAULT_HDI = 0.5
+
+CountryInfo = namedtuple('CountryInfo', ['region', 'code', 'hdi'])
+
+UNKNOWN_COUNTRY = CountryInfo('', '', DEFAULT_HDI)
+
+# Setting up a dictionnary of countries and their respective 3-digit country codes
+lookup_country = {}
+lookup_country['Peru'] = ['Latin America', 'PER']
+lookup_country['India'] = ['India', 'IND']
+lookup_country['Mexico'] = ['North America', 'MEX']
+lookup_country['Asia Pacific'] = ['South Asia', 'IDN']
+lookup_country['Costa Rica'] = ['Latin America', 'CRI']
+lookup_country['Brazil'] = ['Brazil', 'BRA']
+lookup_country['Paraguay'] = ['Latin America', 'PRY']
+lookup_country['Poland'] = ['East Europe', 'POL']
+lookup_country['Greece'] = ['West Europe', 'GRC']
+lookup_country['Tanzania'] = ['Africa', 'TZA']
+lookup_country['Egypt'] = ['Africa', 'EGY']
+lookup_country['Burkina Faso'] = ['Africa', 'BFA']
+lookup_country['Middle East and Africa'] = ['Africa', 'IRN']
+lookup_country['Argentina'] = ['Argentina', 'ARG']
+lookup_country['Romania'] = ['East Europe', 'ROU']
+lookup_country['Germany'] = ['West Europe', 'DEU']
+lookup_country['Chile'] = ['Latin America', 'CHL']
+lookup_country['Colombia'] = ['Latin America', 'COL']
+lookup_country['Russia'] = ['West Europe', 'RUS']
+lookup_country['Malta'] = ['West Europe', 'MLT']
+lookup_country['Singapore'] = ['North Asia', 'SGP']
+lookup_country['Italy'] = ['West Europe', 'ITA']
+lookup_country['Thailand'] = ['South Asia', 'THA']
+lookup_country['South Korea'] = ['North Asia', 'KOR']
+lookup_country['Panama'] = ['Latin America', 'PAN']
+lookup_country['Hong Kong'] = ['China', 'HKG']
+lookup_country['China, Mainland'] = ['China', 'CHN']
+lookup_country['Philippines'] = ['South Asia', 'PHL']
+lookup_country['Indonesia'] = ['South Asia', 'IDN']
+lookup_country['Portugal'] = ['West Europe', 'PRT']
+lookup_country['Botswana'] = ['Africa', 'BWA']
+lookup_country['Uganda'] = ['Africa', 'UGA']
+lookup_country['Hungary'] = ['East Europe', 'HUN']
+lookup_country['Ghana'] = ['Africa', 'GHA']
+lookup_country['Tunisia'] = ['Africa', 'TUN']
+lookup_country['Bulgaria'] = ['East Europe', 'BGR']
+
+lookup_country['Sri Lanka'] = ['South Asia', 'LKA']
+lookup_country['Taiwan'] = ['South Asia', 'TWN']
+lookup_country['Americas'] = ['Latin America', 'CRI']
+lookup_country['Czech Republic'] = ['East Europe', 'CZE']
+lookup_country['Ecuador'] = ['Latin America', 'ECU']
+lookup_country['United States'] = ['United States', 'USA']
+lookup_country['Guatemala'] = ['Latin America', 'GTM']
+lookup_country['Canada'] = ['Canada', 'CAN']
+lookup_country['Turkey'] = ['Turkey', 'TUR']
+lookup_country['Belgium'] = ['West Europe', 'BEL']
+lookup_country['Malaysia'] = ['South Asia', 'MYS']
+lookup_country['Cameroon'] = ['Africa', 'CMR']
+lookup_country['Pakistan'] = ['Middle East', 'PAK']
+lookup_country['Japan'] = ['North Asia', 'JPN']
+lookup_country['Mauritius'] = ['Africa', 'MUS']
+
+lookup_country['Cambodia'] = ['South Asia', 'KHM']
+lookup_country['Montenegro'] = ['East Europe', 'MNE']
+lookup_country['Ukraine'] = ['East Europe', 'UKR']
+lookup_country['Serbia'] = ['East Europe', 'SRB']
+lookup_country['Slovakia'] = ['East Europe', 'SVK']
+lookup_country['El Salvador'] = ['Latin America', 'SLV']
+lookup_country['Europe'] = ['West Europe', 'FRA']
+lookup_country['Iran'] = ['Middle East', 'IRN']
+lookup_country['Morocco'] = ['Africa', 'MAR']
+lookup_country['The Netherlands'] = ['West Europe', 'NLD']
+lookup_country['Norway'] = ['West Europe', 'NOR']
+lookup_country['Spain'] = ['West Europe', 'ESP']
+lookup_country['Lithuania'] = ['East Europe', 'LTU']
+lookup_country['South Africa'] = ['Africa', 'ZAF']
+lookup_country['Venezuela'] = ['Latin America', 'VEN']
+
+lookup_country['Vietnam'] = ['South Asia', 'VNM']
+lookup_country['Nepal'] = ['Middle East', 'NPL']
+lookup_country['Nigeria'] = ['Africa', 'NGA']
+lookup_country['Kazakhstan'] = ['Middle East', 'KAZ']
+lookup_country['Finland'] = ['West Europe', 'FIN']
+lookup_country['Georgia'] = ['East Europe', 'GEO']
+lookup_country['Bahrain'] = ['Africa', 'BHR']
+lookup_country['Namibia'] = ['Africa', 'NAM']
+lookup_country['Australia'] = ['Australia', 'AUS']
+lookup_country['Rwanda'] = ['Africa', 'RWA']
+lookup_country['Denmark'] = ['West Europe', 'DNK']
+lookup_country['Slovenia'] = ['East Europe', 'SVN']
+lookup_country['Switzerland'] = ['West Europe', 'CHE']
+lookup_country['Togo'] = ['Africa', 'TGO']
+lookup_country['Croatia'] = ['East Europe', 'HRV']
+
+lookup_country['Gabon'] = ['Africa', 'GAB']
+lookup_country['Lebanon'] = ['Middle East', 'LBN']
+lookup_country['Bolivia'] = ['East Europe', 'BOL']
+lookup_country['United Kingdom'] = ['West Europe', 'GBR']
+lookup_country['Benin'] = ['Africa', 'BEN']
+lookup_country['France'] = ['West Europe', 'FRA']
+lookup_country['Ethiopia'] = ['Africa', 'ETH']
+lookup_country['Uruguay'] = ['Latin America', 'URY']
+lookup_country['Kyrgyzstan'] = ['Middle East', 'KGZ']
+lookup_country['Mozambique'] = ['Africa', 'MOZ']
+lookup_country['Moldova'] = ['East Europe', 'MDA']
+lookup_country['Ireland'] = ['West Europe', 'IRL']
+lookup_country['Sweden'] = ['West Europe', 'SWE']
+lookup_country['Oman'] = ['Middle East', 'OMN']
+lookup_country['Algeria'] = ['Africa', 'DZA']
+lookup_country['Senegal'] = ['Africa', 'SEN']
+lookup_country['Myanmar'] = ['South Asia', 'MMR']
+
+lookup_country['Azerbaijan'] = ['Middle East', 'AZE']
+lookup_country['Austria'] = ['East Europe', 'AUT']
+lookup_country['New Zealand'] = ['Australia', 'NZL']
+lookup_country['Afghanistan'] = ['Middle East', 'AFG']
+lookup_country['Kenya'] = ['Africa', 'KEN']
+lookup_country['Belarus'] = ['East Europe', 'BLR']
+lookup_country['Cote D\'Ivoire'] = ['Africa', 'CIV']
+lookup_country['Dominican Republic'] = ['Latin America', 'DOM']
+lookup_country['Albania'] = ['East Europe', 'ALB']
+lookup_country['Liberia'] = ['Africa', 'LBR']
+lookup_country['Estonia'] = ['East Europe', 'EST']
+lookup_country['Armenia'] = ['Middle East', 'ARM']
+lookup_country['Macedonia'] = ['East Europe', 'MKD']
+lookup_country['Bosnia and Herzegovina'] = ['East Europe', 'BIH']
+
+lookup_country['Mongolia'] = ['Middle East', 'MNG']
+lookup_country['Jordan'] = ['Middle East', 'JOR']
+lookup_country['Cabo Verde'] = ['Africa', 'CPV']
+lookup_country['Tajikistan'] = ['Middle East', 'TJK']
+lookup_country['Nicaragua'] = ['Latin America', 'NIC']
+lookup_country['United Arab Emirates'] = ['Middle East', 'ARE']
+lookup_country['Latvia'] = ['East Europe', 'LVA']
+lookup_country['Laos'] = ['South Asia', 'LAO']
+lookup_country['Puerto Rico'] = ['Latin America', 'PRI']
+lookup_country['Iceland'] = ['West Europe', 'ISL']
+lookup_country['LUXEMBOURG (CLOSED)'] = ['West Europe', 'LUX']
+
+lookup_country['Qatar'] = ['Middle East', 'QAT']
+lookup_country['Malawi'] = ['Africa', 'MWI']
+lookup_country['Kuwait'] = ['Middle East', 'KWT']
+lookup_country['Seychelles'] = ['South Asia', 'SYC']
+lookup_country['Bangladesh'] = ['South Asia', 'BGD']
+lookup_country['Liechtenstein'] = ['East Europe', 'LIE']
+lookup_country['Haiti'] = ['Latin America', 'HTI']
+lookup_country['Kingdom of Saudi Arabia'] = ['Middle East', 'SAU']
+lookup_country['Cuba'] = ['Latin America', 'CUB']
+lookup_country['Uzbekistan'] = ['Middle East', 'UZB']
+
+lookup_country['Cyprus'] = ['Africa', 'CYP']
+lookup_country['Fiji'] = ['South Asia', 'FJI']
+lookup_country['Mali'] = ['Africa', 'MLI']
+
+
+# Reads the HDI table into a country code -> HDI dictionary
+def load_hdi(path=HDI_CSV):
+    hdi_by_code = {}
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            try:
+                hdi_by_code[row['Code']] = float(row[HDI_COLUMN])
+            except (TypeError, ValueError):
+                pass
+    return hdi_by_code
+
+
+# Joins the country lookup with the HDI table: entity name -> CountryInfo(region, code, hdi)
+def build_country_index(lookup, hdi_by_code):
+    index = {}
+    for name, (region, code) in lookup.items():
+        index[name] = CountryInfo(region, code, hdi_by_code.get(code, DEFAULT_HDI))
+    return index
+
+
+country_index = build_country_index(lookup_country, load_hdi())
+
+
+# Returns the CountryInfo of an entity name, UNKNOWN_COUNTRY if the entity is not known
+def country_info(name):
+    return country_index.get(name, UNKNOWN_COUNTRY)
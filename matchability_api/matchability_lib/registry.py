@@ -0,0 +1,164 @@
+'''
+
+Matchability - Model Registry
+Loads the trained model artifacts once per process and hot-swaps them when a new version is published.
+
+'''
+
+import os
+import pickle
+import shutil
+import threading
+import time
+
+from matchability_api.settings import MODEL_DIR, MODEL_RELOAD_INTERVAL, MODEL_KEEP_VERSIONS, MODEL_SHARED_DIR
+from matchability_lib.bundle import has_bundle, ModelBundle
+from matchability_lib.featurizer import OpportunityFeaturizer
+from matchability_lib.forest import CompiledForest
+from matchability_lib.shared import shared_arrays
+
+VERSION_FILE = 'VERSION'
+
+# Version reported for the artifacts stored directly in MODEL_DIR (before any version was published)
+LEGACY_VERSION = '0'
+
+
+# Returns the directory holding the artifacts of a given version
+def artifact_dir(version, model_dir=MODEL_DIR):
+    if version == LEGACY_VERSION:
+        return model_dir
+    return os.path.join(model_dir, version)
+
+
+# Returns the (version, mtime) token of the currently published model
+def read_version_token(model_dir=MODEL_DIR):
+    path = os.path.join(model_dir, VERSION_FILE)
+    try:
+        with open(path) as f:
+            version = f.read().strip()
+        return version or LEGACY_VERSION, os.stat(path).st_mtime
+    except (IOError, OSError):
+        return LEGACY_VERSION, None
+
+
+# Makes a fully written artifact directory the active model version. Called by the training job last,
+# so serving processes never pick up a partially written set of artifacts.
+def publish_version(version, model_dir=MODEL_DIR, keep=MODEL_KEEP_VERSIONS):
+    tmp_path = os.path.join(model_dir, VERSION_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(model_dir, VERSION_FILE))
+
+    # prune the oldest versions, always keeping the one just published
+    versions = sorted(v for v in os.listdir(model_dir)
+                      if os.path.isdir(os.path.join(model_dir, v)) and v.isdigit() and v != version)
+    for old in versions[:max(0, len(versions) - (keep - 1))]:
+        shutil.rmtree(os.path.join(model_dir, old), ignore_errors=True)
+
+
+# All the artifacts of one model version. Never mutated once loaded, so a request holding a
+# snapshot always sees a consistent set of artifacts even if a reload happens meanwhile.
+class ModelSnapshot(object):
+
+    def __init__(self, version, kmeans, vectorizer, cluster_terms, forest, features):
+        self.version = version
+        self.kmeans = kmeans
+        self.vectorizer = vectorizer
+        self.cluster_terms = cluster_terms
+        self.forest = forest
+        self.features = features
+        self.featurizer = OpportunityFeaturizer(vectorizer, kmeans, cluster_terms, features)
+
+    # Versions trained with a model bundle are memory-mapped from it. For the older versions (pickles only), with
+    # a shared directory, the forest is read from the version's shared memory segment, compiled from
+    # matcha_model.pickle by the first process loading the version. Otherwise each process compiles its own copy.
+    @classmethod
+    def load(cls, version, model_dir=MODEL_DIR, shared_dir=MODEL_SHARED_DIR):
+        path = artifact_dir(version, model_dir)
+
+        if has_bundle(path):
+            bundle = ModelBundle.open(path)
+            return cls(version,
+                       kmeans=bundle.kmeans(),
+                       vectorizer=bundle.vectorizer(),
+                       cluster_terms=bundle.cluster_terms,
+                       forest=bundle.forest(),
+                       features=bundle.features)
+
+        def load_pickle(name):
+            with open(os.path.join(path, name + '.pickle'), 'rb') as f:
+                return pickle.load(f)
+
+        if shared_dir:
+            segment = version
+            if version == LEGACY_VERSION:
+                # the legacy artifacts are overwritten in place, their segment is identified by their date
+                segment += '-' + str(int(os.stat(os.path.join(path, 'matcha_model.pickle')).st_mtime))
+            forest = CompiledForest.from_arrays(shared_arrays(
+                CompiledForest.ARRAYS, segment,
+                lambda: CompiledForest.from_sklearn(load_pickle('matcha_model')).arrays(), shared_dir))
+        else:
+            forest = CompiledForest.from_sklearn(load_pickle('matcha_model'))
+
+        return cls(version,
+                   kmeans=load_pickle('kmeans'),
+                   vectorizer=load_pickle('vectorizer'),
+                   cluster_terms=load_pickle('cluster_terms'),
+                   forest=forest,
+                   features=load_pickle('features'))
+
+
+# Process-wide holder of the active ModelSnapshot, shared by all the request threads
+class ModelRegistry(object):
+
+    def __init__(self, model_dir=MODEL_DIR, check_interval=MODEL_RELOAD_INTERVAL):
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        # held by the thread checking for, and loading, a new version
+        self._load_lock = threading.Lock()
+        self._snapshot = None
+        self._token = None
+        self._next_check = 0
+
+    # Returns the active snapshot, checking at most every `check_interval` seconds for a new version
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None or time.time() >= self._next_check:
+            snapshot = self._refresh(force=False)
+        return snapshot
+
+    # Forces a check for a new version
+    def reload(self):
+        return self._refresh(force=True)
+
+    # A single thread checks and loads a new version. Meanwhile the other threads keep the active snapshot instead
+    # of waiting for the load; they only wait when there is no snapshot yet, or to force a reload.
+    def _refresh(self, force):
+        snapshot = self._snapshot
+        if not self._load_lock.acquire(force or snapshot is None):
+            return snapshot
+        try:
+            now = time.time()
+            # another thread may have refreshed while we were waiting for the lock
+            if not force and self._snapshot is not None and now < self._next_check:
+                return self._snapshot
+
+            token = read_version_token(self.model_dir)
+            if self._snapshot is None or token != self._token:
+                try:
+                    # the new snapshot is fully built before being swapped in, by a single assignment
+                    self._snapshot = ModelSnapshot.load(token[0], self.model_dir)
+                    self._token = token
+                except Exception as e:
+                    if self._snapshot is None:
+                        raise
+                    print("Failed to load model version", token[0], "- keeping version",
+                          self._snapshot.version, "Error is:", e)
+
+            self._next_check = now + self.check_interval
+            return self._snapshot
+        finally:
+            self._load_lock.release()
+
+
+registry = ModelRegistry()
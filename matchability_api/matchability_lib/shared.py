@@ -0,0 +1,75 @@
+'''
+
+Matchability - Shared Model Memory
+Keeps the model arrays of each version in a shared memory segment (.npy files on a tmpfs such as /dev/shm),
+mapped read-only by every API process, so the workers of a server share a single copy of the model.
+
+'''
+
+import ctypes
+import gc
+import os
+import shutil
+
+import numpy as np
+
+from matchability_api.settings import MODEL_SHARED_DIR
+
+# Number of segments kept: the active version and the previous one, possibly still used by a slower worker
+SHARED_KEEP_VERSIONS = 2
+
+
+def segment_dir(version, shared_dir=MODEL_SHARED_DIR):
+    return os.path.join(shared_dir, str(version))
+
+
+# Writes the arrays of a version to its segment. The segment is written in a temporary directory renamed
+# at the end, so a process never maps a partially written segment.
+def export_arrays(arrays, version, shared_dir=MODEL_SHARED_DIR):
+    path = segment_dir(version, shared_dir)
+    tmp_path = os.path.join(shared_dir, '.' + str(version) + '.' + str(os.getpid()) + '.tmp')
+    os.makedirs(tmp_path)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, name + '.npy'), np.ascontiguousarray(array))
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process exported the same version meanwhile
+        if not os.path.isdir(path):
+            raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+# Maps the arrays of a version read-only: the pages are shared by all the processes mapping them
+def map_arrays(names, version, shared_dir=MODEL_SHARED_DIR):
+    path = segment_dir(version, shared_dir)
+    return dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r')) for name in names)
+
+
+# Returns the shared arrays of a version, calling `build()` to create them if no process did it yet
+def shared_arrays(names, version, build, shared_dir=MODEL_SHARED_DIR, keep=SHARED_KEEP_VERSIONS):
+    if not os.path.isdir(segment_dir(version, shared_dir)):
+        os.makedirs(shared_dir, exist_ok=True)
+        export_arrays(build(), version, shared_dir)
+        prune_segments(version, shared_dir, keep)
+        release_memory()
+    return map_arrays(names, version, shared_dir)
+
+
+# Gives the memory freed after building the arrays back to the system (glibc only), so the process exporting
+# a segment does not keep the heap of its private copy of the model
+def release_memory():
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+# Removes the oldest segments. The processes still mapping them keep their pages until they unmap them.
+def prune_segments(version, shared_dir=MODEL_SHARED_DIR, keep=SHARED_KEEP_VERSIONS):
+    versions = sorted(v for v in os.listdir(shared_dir)
+                      if not v.startswith('.') and os.path.isdir(os.path.join(shared_dir, v)) and v != str(version))
+    for old in versions[:max(0, len(versions) - (keep - 1))]:
+        shutil.rmtree(os.path.join(shared_dir, old), ignore_errors=True)
@@ -0,0 +1,156 @@
+'''
+
+Matchability - Training Steps
+Data cleaning and manipulation steps of the training (matcha.py) on the extracted opportunities and applications,
+kept apart from the extraction and the modelling so they can be benchmarked in isolation (benchmarks/microbench.py).
+
+'''
+
+import numpy as np
+import pandas as pd
+
+from matchability_api.settings import HOT_SEASON_DAYS, HOT_SEASON_START
+from matchability_lib.dates import parse_date_column
+
+
+# Dates of the extraction with a two digit year: 15-06-01 00:00:00
+TWO_DIGIT_YEAR = r'^\d{2}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$'
+
+# Unreadable dates of the extraction with a wrong century: 0015-06-01 00:00:00, 1115-06-01 00:00:00
+WRONG_CENTURY = r'^(?!20)\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$'
+
+
+# Repairs the badly formatted dates of a column (strings, as extracted). Returns the repaired column, the number of
+# repaired dates and the mask of the dates that stay unreadable. Missing dates are left as they are.
+def normalize_dates(values):
+    text = values.astype(str)
+    present = values.notnull().values & (text != 'nan').values
+    parsed = parse_date_column(text.where(present))
+
+    two_digit_year = present & text.str.match(TWO_DIGIT_YEAR).values
+    wrong_century = present & np.isnat(parsed) & text.str.match(WRONG_CENTURY).values
+    repaired = text.copy()
+    repaired[two_digit_year] = '20' + text[two_digit_year]
+    repaired[wrong_century] = '20' + text[wrong_century].str[2:]
+    fixed = two_digit_year | wrong_century
+    parsed[fixed] = parse_date_column(repaired[fixed])
+
+    unreadable = present & np.isnat(parsed)
+    return values.where(~fixed, repaired), int((fixed & ~unreadable).sum()), unreadable
+
+
+# Repairs the badly formatted dates of the date columns and removes the opportunities with an unreadable date.
+# Returns the cleaned opportunities and the number of dates repaired per column and of opportunities removed.
+def clean_date_columns(opps, date_columns):
+    columns = {}
+    report = {'repaired': {}, 'removed': 0}
+    unreadable = np.zeros(len(opps), dtype=bool)
+    for column in date_columns:
+        columns[column], report['repaired'][column], column_unreadable = normalize_dates(opps[column])
+        print("Cleaning date column:", column, "-", report['repaired'][column], "dates repaired,",
+              int(column_unreadable.sum()), "unreadable.")
+        unreadable |= column_unreadable
+
+    report['removed'] = int(unreadable.sum())
+    opps = opps.assign(**columns).loc[~unreadable]
+    print("Removed", report['removed'], "rows with unreadable dates.")
+    return opps, report
+
+
+# Aggregates of the applications of each opportunity, added to the opportunities by extra_columns():
+# column --> (column of the applications, aggregation). 'accepted' is 1 for an accepted application, 0 otherwise.
+APPLICATION_AGGREGATES = {
+    'accepted_count': ('accepted', 'sum'),
+}
+
+
+# Aggregates of the applications per opportunity (see APPLICATION_AGGREGATES), one row per opportunity_id
+def application_aggregates(apps):
+    apps = apps.assign(accepted=(apps['an_status'] == 'accepted').astype(int))
+    return apps.groupby('opportunity_id').agg(**APPLICATION_AGGREGATES)
+
+
+# Number of days of the experiences (`duration_min` days from their earliest start date) in the popular season of the
+# year they start: `season_days` days from `season_start` (month, day). As in the former day by day count, the
+# experiences not starting at midnight, or without a start date, have no day in the season.
+def season_overlap(earliest_start_dates, durations, season_start=HOT_SEASON_START, season_days=HOT_SEASON_DAYS):
+    start = parse_date_column(earliest_start_dates)
+    start_day = start.astype('datetime64[D]')
+    days = np.clip(np.nan_to_num(pd.to_numeric(durations, errors='coerce').astype(float)), 0, None).astype(int)
+
+    month, day = season_start
+    season_first_day = (start.astype('datetime64[Y]').astype('datetime64[M]') + (month - 1)).astype('datetime64[D]') \
+        + (day - 1)
+    first_day = np.maximum(start_day, season_first_day)
+    last_day = np.minimum(start_day + days, season_first_day + season_days)
+    with np.errstate(invalid='ignore'):
+        overlap = (last_day - first_day).astype(np.int64)
+    # NaT != NaT: no overlap without a start date
+    at_midnight = start == start_day.astype(start.dtype)
+    return np.where(at_midnight, np.maximum(overlap, 0), 0)
+
+
+# Adds the new variables of interest of each opportunity: the aggregates of its applications (its number of accepted
+# applications...) and how many days of the experience fall in the popular summer period
+def extra_columns(opps, apps):
+    # a single merge of the application aggregates, 0 for the opportunities without applications
+    aggregates = application_aggregates(apps)
+    opps = opps.merge(aggregates, how='left', left_on='opportunity_id', right_index=True)
+    opps[list(aggregates.columns)] = opps[list(aggregates.columns)].fillna(0).astype(int)
+
+    # "Hot summer zones overlap": how many possible days of the experience intersect the "popular summer days"
+    hot_days_intersection = season_overlap(opps['earliest_start_date'], opps['duration_min'])
+    opps['hot_days_intersection'] = hot_days_intersection
+    opps['popular_time_period_factor'] = np.round(hot_days_intersection / HOT_SEASON_DAYS, 1)
+    return opps.reset_index(drop=True)
+
+
+# Expand opportunities --> one row for one opening, with our Y variable 'matched': whether the opening has found a
+# match or not. The openings and accepted_count columns must be of 'int' type. Replaced by weighted_openings(), kept
+# to validate it (TRAINING_EXPAND_OPENINGS).
+def expand_openings(opps):
+    # use the same columns as the current table
+    column_names = opps.columns
+    column_names = column_names.append(pd.Index(["matched"]))
+
+    # for efficiency purposes, we will append all single row dataframes to a list and then
+    # concatenate the list of dataframes together
+    df_list = []
+    for index, row in opps.iterrows():
+        row_data = row.values
+        row_columns = row.index
+        try:
+            num_openings = row['openings']
+            num_matched = row['accepted_count']
+        except Exception as e:
+            print("Error:", e)
+
+        # append the matched=True
+        for i in range(num_matched):
+            row_data = row.values
+            row_data = row_data.tolist()
+            row_data.append(1)
+            df_list.append(pd.DataFrame([row_data], columns=column_names))
+
+        # apppend the matched=False
+        for i in range(num_openings - num_matched):
+            row_data = row.values
+            row_data = row_data.tolist()
+            row_data.append(0)
+            df_list.append(pd.DataFrame([row_data], columns=column_names))
+
+    # concatenate all the dataframes together
+    return pd.concat(df_list)
+
+
+# Same training data as expand_openings() with at most two rows per opportunity: its matched openings (matched=1) and
+# its unmatched openings (matched=0), the number of openings of each row in its 'weight' column (integer sample
+# weights). The openings and accepted_count columns must be of 'int' type.
+def weighted_openings(opps):
+    positions = np.arange(len(opps))
+    matched = opps.assign(matched=1, weight=opps['accepted_count'].values)
+    unmatched = opps.assign(matched=0, weight=(opps['openings'] - opps['accepted_count']).values)
+    rows = pd.concat([matched, unmatched])
+    # rows of an opportunity next to each other, the matched one first, as in the expansion
+    rows = rows.iloc[np.argsort(np.concatenate([positions, positions]), kind='stable')]
+    return rows[rows['weight'].values > 0].reset_index(drop=True)